@@ -1,10 +1,15 @@
 #!/usr/bin/env python3
 import argparse
+import fcntl
+import os
 import platform
 import tarfile
+import time
 import urllib.request as req
+from contextlib import contextmanager
 from pathlib import Path
 from tempfile import NamedTemporaryFile
+from typing import Iterator
 
 
 def reporthook(count: float, block_size: float, total_size: float) -> None:
@@ -44,7 +49,18 @@ def _mamba_forge(dest_dir: Path) -> None:
     target.chmod(0o755)
 
 
-def _micromamba(dest_dir: Path) -> None:
+@contextmanager
+def _lock(lock_file: Path) -> Iterator[None]:
+    """Hold an exclusive lock, concurrent deployments wait for each other."""
+    with lock_file.open("a") as stream:
+        fcntl.flock(stream, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(stream, fcntl.LOCK_UN)
+
+
+def _micromamba(dest_dir: Path, max_age: float = 7.0) -> None:
     system = platform.system().lower()
     plt = platform.machine()
     target = dest_dir / "bin" / "micromamba"
@@ -52,25 +68,51 @@ def _micromamba(dest_dir: Path) -> None:
         raise ValueError("Only Linux based deployment is supported.")
     if plt.startswith("x86"):
         plt = "64"
-    with NamedTemporaryFile(suffix=".tar") as temp_f:
-        _url_retrieve(
-            f"https://micro.mamba.pm/api/micromamba/linux-{plt}/latest",
-            temp_f.name,
-        )
-        with tarfile.open(temp_f.name, mode="r:bz2") as tar:
-            member = tar.getmember("bin/micromamba")
-            print("🔧 Extracting: bin/micromamba")
-            tar.extract(member, path=str(dest_dir))
-    target.chmod(0o755)
+    target.parent.mkdir(parents=True, exist_ok=True)
+    with _lock(dest_dir / ".micromamba.lock"):
+        if (
+            os.access(target, os.X_OK)
+            and time.time() - target.stat().st_mtime < max_age * 86400
+        ):
+            print("✅ Using existing micromamba: {}".format(target))
+            return
+        with NamedTemporaryFile(suffix=".tar") as temp_f:
+            _url_retrieve(
+                f"https://micro.mamba.pm/api/micromamba/linux-{plt}/latest",
+                temp_f.name,
+            )
+            try:
+                with tarfile.open(temp_f.name, mode="r:bz2") as tar:
+                    member = tar.extractfile("bin/micromamba")
+                    if member is None:
+                        raise KeyError("bin/micromamba")
+                    binary = member.read()
+            except (tarfile.TarError, KeyError, OSError):
+                if not os.access(target, os.X_OK):
+                    raise
+                print("⚠️ Update failed, using existing: {}".format(target))
+                return
+        print("🔧 Extracting: bin/micromamba")
+        # Replace the binary atomically, other roles might be using it.
+        with NamedTemporaryFile(
+            dir=target.parent, prefix=".micromamba", delete=False
+        ) as new_target:
+            new_target.write(binary)
+        Path(new_target.name).chmod(0o755)
+        os.replace(new_target.name, target)
 
 
-def download(mamba: str = "micromamba", dest_dir: Path = Path("/tmp")) -> None:
+def download(
+    mamba: str = "micromamba",
+    dest_dir: Path = Path("/tmp"),
+    max_age: float = 7.0,
+) -> None:
     """Download the conda forge install script."""
     dest_dir.mkdir(parents=True, exist_ok=True)
     if "forge" in mamba:
         _mamba_forge(dest_dir)
     else:
-        _micromamba(dest_dir)
+        _micromamba(dest_dir, max_age=max_age)
 
 
 def _cli() -> argparse.ArgumentParser:
@@ -86,10 +128,16 @@ def _cli() -> argparse.ArgumentParser:
         default="micromamba",
         choices=("micromamba", "mambaforge"),
     )
+    parser.add_argument(
+        "--max-age",
+        type=float,
+        default=7.0,
+        help="Days after which an existing micromamba is updated.",
+    )
     args = parser.parse_args()
     return args
 
 
 if __name__ == "__main__":
     args = _cli()
-    download(args.type, args.target_path)
+    download(args.type, args.target_path, max_age=args.max_age)
@@ -0,0 +1,266 @@
+#!/usr/bin/env python3
+"""Pull container images in the background and wait for the pulls.
+
+``start`` pulls the images concurrently in a detached process and returns
+immediately, ``wait`` blocks until the background pull of the images has
+finished and pulls the images itself if no background pull has succeeded
+during this deployment. Images whose local digest matches the digest in the
+registry are not pulled again.
+"""
+
+import argparse
+import fcntl
+import json
+import os
+import re
+import shutil
+import subprocess
+import sys
+import time
+import urllib.request as req
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import IO, Dict, List, Optional, Tuple
+from urllib.error import HTTPError
+
+STATE_DIR = Path("~/.cache/freva-deployment/images").expanduser()
+MANIFEST_TYPES = (
+    "application/vnd.oci.image.index.v1+json",
+    "application/vnd.docker.distribution.manifest.list.v2+json",
+    "application/vnd.oci.image.manifest.v1+json",
+    "application/vnd.docker.distribution.manifest.v2+json",
+)
+
+
+def _engine(name: str) -> str:
+    """Get the path of the container engine, fall back to the other one."""
+    path = "/usr/local/bin:" + os.environ.get("PATH", "")
+    other = "podman" if "docker" in Path(name).name else "docker"
+    engine = shutil.which(name, path=path) or shutil.which(other, path=path)
+    if not engine:
+        raise SystemExit("Neither Docker nor Podman is installed.")
+    return engine
+
+
+def _state_file(state_dir: Path, image: str, suffix: str) -> Path:
+    return state_dir / (re.sub(r"[^A-Za-z0-9_.-]+", "_", image) + suffix)
+
+
+def _split_image(image: str) -> Tuple[str, str, str]:
+    """Split an image into registry, repository and tag."""
+    name, tag = image, "latest"
+    if ":" in image.rsplit("/", 1)[-1]:
+        name, tag = image.rsplit(":", 1)
+    registry, _, repo = name.partition("/")
+    if not repo or not (
+        "." in registry or ":" in registry or registry == "localhost"
+    ):
+        registry, repo = "registry-1.docker.io", name
+        if "/" not in repo:
+            repo = f"library/{repo}"
+    elif registry == "docker.io":
+        registry = "registry-1.docker.io"
+    return registry, repo, tag
+
+
+def remote_digest(image: str, timeout: float = 10.0) -> Optional[str]:
+    """Ask the registry for the digest of an image, None if unknown."""
+    registry, repo, tag = _split_image(image)
+    request = req.Request(
+        f"https://{registry}/v2/{repo}/manifests/{tag}",
+        headers={"Accept": ", ".join(MANIFEST_TYPES)},
+        method="HEAD",
+    )
+    try:
+        try:
+            with req.urlopen(request, timeout=timeout) as res:
+                return res.headers.get("Docker-Content-Digest")
+        except HTTPError as error:
+            challenge = error.headers.get("WWW-Authenticate", "")
+            if error.code != 401 or not challenge.startswith("Bearer"):
+                return None
+        params = dict(re.findall(r'(\w+)="([^"]*)"', challenge))
+        realm = params.pop("realm")
+        query = "&".join(f"{k}={v}" for k, v in params.items())
+        with req.urlopen(f"{realm}?{query}", timeout=timeout) as res:
+            auth = json.loads(res.read())
+        token = auth.get("token") or auth.get("access_token")
+        request.add_header("Authorization", f"Bearer {token}")
+        with req.urlopen(request, timeout=timeout) as res:
+            return res.headers.get("Docker-Content-Digest")
+    except Exception:
+        return None
+
+
+def local_digests(engine: str, image: str) -> List[str]:
+    """The digests of the locally stored image."""
+    res = subprocess.run(
+        [
+            engine,
+            "image",
+            "inspect",
+            "--format",
+            "{{json .RepoDigests}}",
+            image,
+        ],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL,
+        universal_newlines=True,
+    )
+    if res.returncode != 0:
+        return []
+    try:
+        return [d.rpartition("@")[-1] for d in json.loads(res.stdout) or []]
+    except ValueError:
+        return []
+
+
+def pull(engine: str, image: str, state_dir: Path, run_id: str) -> Dict:
+    """Pull an image unless it is up to date and save the outcome."""
+    start = time.time()
+    digest = remote_digest(image)
+    status = {"image": image, "digest": digest, "run_id": run_id}
+    if digest and digest in local_digests(engine, image):
+        status.update(returncode=0, pulled=False, message="up to date")
+    else:
+        res = subprocess.run(
+            [engine, "pull", image],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            universal_newlines=True,
+        )
+        lines = res.stdout.strip().splitlines()
+        status.update(
+            returncode=res.returncode,
+            pulled=res.returncode == 0,
+            message=lines[-1] if lines else "",
+        )
+    status["duration"] = time.time() - start
+    status_file = _state_file(state_dir, image, ".json")
+    temp_file = status_file.with_suffix(f".{os.getpid()}.tmp")
+    temp_file.write_text(json.dumps(status))
+    os.replace(temp_file, status_file)
+    return status
+
+
+def _lock(state_dir: Path, image: str, timeout: float = 0) -> Optional[IO]:
+    """Lock an image, None if another process holds the lock too long."""
+    stream = _state_file(state_dir, image, ".lock").open("a")
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            fcntl.flock(stream, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return stream
+        except BlockingIOError:
+            if time.monotonic() >= deadline:
+                stream.close()
+                return None
+            time.sleep(1)
+
+
+def start(args: argparse.Namespace) -> None:
+    """Pull the images in a detached background process."""
+    engine = _engine(args.engine)
+    locks = {}
+    for image in dict.fromkeys(args.images):
+        lock = _lock(args.state_dir, image)
+        if lock is None:
+            print("⏳ Already pulling: {}".format(image))
+            continue
+        try:
+            _state_file(args.state_dir, image, ".json").unlink()
+        except FileNotFoundError:
+            pass
+        locks[image] = lock
+    if not locks:
+        return
+    print("🚀 Pulling in the background: {}".format(" ".join(locks)))
+    sys.stdout.flush()
+    if os.fork() != 0:
+        return
+    # The child holds the locks, until the pull of the image is done.
+    os.setsid()
+    devnull = os.open(os.devnull, os.O_RDWR)
+    for fd in range(3):
+        os.dup2(devnull, fd)
+
+    def _pull(image: str) -> None:
+        try:
+            pull(engine, image, args.state_dir, args.run_id)
+        finally:
+            locks[image].close()
+
+    try:
+        with ThreadPoolExecutor(max_workers=args.jobs) as pool:
+            list(pool.map(_pull, locks))
+    finally:
+        os._exit(0)
+
+
+def wait(args: argparse.Namespace) -> None:
+    """Wait for the background pulls, pull the images that are missing."""
+    engine = _engine(args.engine)
+    for image in dict.fromkeys(args.images):
+        lock = _lock(args.state_dir, image, timeout=args.timeout)
+        if lock is None:
+            print(
+                "⚠️ Still pulling after {:.0f}s: {}".format(
+                    args.timeout, image
+                )
+            )
+            continue
+        with lock:
+            status_file = _state_file(args.state_dir, image, ".json")
+            try:
+                status = json.loads(status_file.read_text())
+            except (OSError, ValueError):
+                status = {}
+            if (
+                not args.run_id
+                or status.get("run_id") != args.run_id
+                or status.get("returncode") != 0
+            ):
+                status = pull(engine, image, args.state_dir, args.run_id)
+        if status["returncode"] != 0:
+            print("⚠️ Pull failed: {} ({})".format(image, status["message"]))
+        elif status["pulled"]:
+            print("✅ Pulled: {} ({:.0f}s)".format(image, status["duration"]))
+        else:
+            print("✅ Up to date: {}".format(image))
+
+
+def _cli() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("command", choices=("start", "wait"))
+    parser.add_argument("images", nargs="+", help="The images to pull.")
+    parser.add_argument(
+        "--engine", default="docker", help="The container engine."
+    )
+    parser.add_argument(
+        "--run-id",
+        default="",
+        help="Id of the deployment, pulls of other deployments are ignored.",
+    )
+    parser.add_argument(
+        "--jobs", type=int, default=4, help="Number of concurrent pulls."
+    )
+    parser.add_argument(
+        "--timeout",
+        type=float,
+        default=3600,
+        help="Seconds to wait for a background pull.",
+    )
+    parser.add_argument(
+        "--state-dir",
+        type=Path,
+        default=STATE_DIR,
+        help="Directory for the lock and status files.",
+    )
+    args = parser.parse_args()
+    args.state_dir.mkdir(parents=True, exist_ok=True)
+    return args
+
+
+if __name__ == "__main__":
+    args = _cli()
+    {"start": start, "wait": wait}[args.command](args)
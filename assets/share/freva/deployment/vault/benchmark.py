@@ -0,0 +1,160 @@
+"""Load test of the secret reader against a local fake vault.
+
+The fake vault answers every request after a configurable delay. The
+benchmark fires concurrent secret reads at the rest api and reports the
+throughput with and without the secret cache, for example::
+
+    python benchmark.py --requests 2000 --concurrency 200 --latency 0.02
+"""
+
+import argparse
+import base64
+import json
+import os
+import socket
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+import requests
+
+
+class FakeVault(BaseHTTPRequestHandler):
+    """Minimal kv v1 vault that delays every answer."""
+
+    latency: float = 0.02
+    secrets: Dict[str, Dict[str, str]] = {"data": {"db.user": "freva"}}
+    requests: int = 0
+    lock = threading.Lock()
+
+    def log_message(self, *args: Any) -> None:
+        pass
+
+    def _send(self, code: int, body: Optional[Dict[str, Any]] = None) -> None:
+        time.sleep(self.latency)
+        with self.lock:
+            FakeVault.requests += 1
+        content = json.dumps(body).encode() if body is not None else b""
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def do_GET(self) -> None:
+        path = self.path.partition("?")[0]
+        if path == "/v1/sys/init":
+            self._send(200, {"initialized": True})
+        elif path == "/v1/sys/seal-status":
+            self._send(200, {"sealed": False})
+        elif path == "/v1/sys/mounts":
+            self._send(200, {"secret/": {}})
+        elif path == "/v1/auth/token/lookup-self":
+            self._send(200, {"data": {}})
+        elif path.removeprefix("/v1/secret/") in self.secrets:
+            self._send(200, {"data": self.secrets[path[11:]]})
+        else:
+            self._send(404, {"errors": []})
+
+    def do_POST(self) -> None:
+        length = int(self.headers.get("Content-Length", 0))
+        self.secrets[self.path[11:]] = json.loads(self.rfile.read(length))
+        self._send(204)
+
+
+def free_port() -> int:
+    """Get a free local port."""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return int(sock.getsockname()[1])
+
+
+def run_load(url: str, num_requests: int, concurrency: int) -> float:
+    """Read a secret concurrently and return the requests per second."""
+    local = threading.local()
+
+    def read(_: int) -> int:
+        if not hasattr(local, "session"):
+            local.session = requests.Session()
+        return int(local.session.get(url, timeout=60).status_code)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        codes = list(pool.map(read, range(num_requests)))
+    duration = time.perf_counter() - start
+    if set(codes) != {200}:
+        raise RuntimeError(f"Unexpected status codes: {set(codes)}")
+    return num_requests / duration
+
+
+def cli() -> argparse.Namespace:
+    """Set up the command line interface."""
+    parser = argparse.ArgumentParser(
+        prog=sys.argv[0],
+        description=__doc__.splitlines()[0],
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+    parser.add_argument(
+        "--requests", type=int, default=1000, help="Number of reads."
+    )
+    parser.add_argument(
+        "--concurrency", type=int, default=100, help="Concurrent clients."
+    )
+    parser.add_argument(
+        "--latency",
+        type=float,
+        default=0.02,
+        help="Seconds the fake vault takes to answer a request.",
+    )
+    return parser.parse_args()
+
+
+def main() -> None:
+    """Run the benchmark."""
+    args = cli()
+    FakeVault.latency = args.latency
+    vault = ThreadingHTTPServer(("127.0.0.1", 0), FakeVault)
+    threading.Thread(target=vault.serve_forever, daemon=True).start()
+    key_file = Path(tempfile.mkdtemp()) / "keys"
+    key_file.write_bytes(
+        base64.b64encode(json.dumps({"keys": [], "token": "t"}).encode())
+    )
+    os.environ["KEY_FILE"] = str(key_file)
+    os.environ["VAULT_ADDR"] = f"http://127.0.0.1:{vault.server_port}"
+    sys.path.insert(0, str(Path(__file__).parent))
+    import runserver
+    import uvicorn
+
+    port = free_port()
+    server = uvicorn.Server(
+        uvicorn.Config(runserver.app, port=port, log_level="warning")
+    )
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    url = f"http://127.0.0.1:{port}/vault/data/{'0' * 128}"
+    print(
+        f"{args.requests} reads, {args.concurrency} clients, "
+        f"{args.latency * 1000:.0f} ms vault latency, "
+        f"{runserver.WORKERS} vault workers"
+    )
+    print(f"{'serial vault reads':<24}{1 / args.latency:>10.1f} req/s")
+    for name, ttl in (("without cache", 0.0), ("with cache", 60.0)):
+        runserver.Vault.cache.ttl = ttl
+        runserver.Vault.cache.invalidate()
+        FakeVault.requests = 0
+        rate = run_load(url, args.requests, args.concurrency)
+        print(
+            f"{name:<24}{rate:>10.1f} req/s"
+            f"{FakeVault.requests:>8} vault requests"
+        )
+    server.should_exit = True
+
+
+if __name__ == "__main__":
+    main()
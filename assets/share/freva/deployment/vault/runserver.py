@@ -10,21 +10,42 @@ Overview
 """
 
 import argparse
+import asyncio
 import base64
+import fcntl
+import hashlib
 import json
 import logging
 import os
 import pathlib
 import random
 import sys
+import threading
 import time
+from collections import OrderedDict, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack, contextmanager
+from functools import partial
 from subprocess import Popen
-from typing import Annotated, Dict, List, Optional, TypedDict, cast
+from typing import (
+    Annotated,
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Tuple,
+    TypedDict,
+    cast,
+)
 
 import hvac
 import requests
 from fastapi import Body, FastAPI, Header, HTTPException, Path, status
 from fastapi.responses import JSONResponse
+from pydantic import BaseModel, Field
 
 KeyType = TypedDict("KeyType", {"keys": List[str], "token": str})
 if os.getenv("KEY_FILE"):
@@ -40,6 +61,13 @@ elif os.getenv("CONDA_PREFIX"):
 else:
     KEY_FILE = pathlib.Path("/vault/file/keys")
 VAULT_ADDR = os.environ.get("VAULT_ADDR", "http://127.0.0.1:8200")
+CACHE_TTL = float(os.environ.get("VAULT_CACHE_TTL", "60"))
+CACHE_SIZE = int(os.environ.get("VAULT_CACHE_SIZE", "128"))
+WORKERS = int(os.environ.get("VAULT_WORKERS", "16"))
+EXECUTOR = ThreadPoolExecutor(max_workers=WORKERS, thread_name_prefix="vault")
+LOCK_DIR = pathlib.Path(
+    os.environ.get("VAULT_LOCK_DIR", KEY_FILE.parent / "locks")
+)
 POLICY = """
     path "secret" {
         capabilities = ["create", "read", "update", "delete", "list"]
@@ -112,6 +140,202 @@ def cli() -> str:
     return str(args.config.expanduser().absolute())
 
 
+async def run_in_pool(
+    func: Callable[..., Any], *args: Any, **kwargs: Any
+) -> Any:
+    """Run blocking vault I/O in the thread pool, not on the event loop."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(EXECUTOR, partial(func, *args, **kwargs))
+
+
+def create_session() -> requests.Session:
+    """Create a keep-alive session with a connection for each worker."""
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(
+        pool_connections=1, pool_maxsize=WORKERS
+    )
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+class SecretCache:
+    """Thread safe LRU cache of secrets that expire after a given time.
+
+    The server runs several worker processes, each with its own cache. A
+    cached secret is only used while the generation of its path, which
+    every worker increases when it writes the path, hasn't changed.
+
+    Parameters
+    ----------
+    maxsize: int
+        Maximum number of cached secret paths.
+    ttl: float
+        Seconds after which a cached secret is read from the vault again,
+        0 disables the cache.
+    generation: Callable[[str], int], default: None
+        Get the current generation of a path.
+    """
+
+    def __init__(
+        self,
+        maxsize: int = CACHE_SIZE,
+        ttl: float = CACHE_TTL,
+        generation: Optional[Callable[[str], int]] = None,
+    ) -> None:
+        self.maxsize = max(maxsize, 0)
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.generation = generation or (lambda path: 0)
+        self._lock = threading.Lock()
+        self._data: OrderedDict[str, Tuple[float, int, Dict[str, str]]] = (
+            OrderedDict()
+        )
+
+    def get(self, path: str) -> Optional[Dict[str, str]]:
+        """Get a copy of a cached secret, None if it is not cached."""
+        generation = self.generation(path)
+        with self._lock:
+            expires, cached, secret = self._data.get(path, (0.0, 0, {}))
+            if expires > time.monotonic() and cached == generation:
+                self._data.move_to_end(path)
+                self.hits += 1
+                return secret.copy()
+            self._data.pop(path, None)
+            self.misses += 1
+            return None
+
+    def set(
+        self,
+        path: str,
+        secret: Dict[str, str],
+        generation: Optional[int] = None,
+    ) -> None:
+        """Add a secret to the cache.
+
+        Parameters
+        ----------
+        path: str
+            The secret path.
+        secret: dict[str, str]
+            The secrets of the path.
+        generation: int, default: None
+            The generation of the path before the secret was read. The
+            secret is not cached if the path has been written since.
+        """
+        if self.ttl <= 0 or self.maxsize == 0:
+            return
+        current = self.generation(path)
+        if generation is not None and generation != current:
+            return
+        with self._lock:
+            self._data[path] = (
+                time.monotonic() + self.ttl,
+                current,
+                secret.copy(),
+            )
+            self._data.move_to_end(path)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def invalidate(self, path: Optional[str] = None) -> None:
+        """Remove a secret, or all secrets, from the cache."""
+        with self._lock:
+            if path is None:
+                self._data.clear()
+            else:
+                self._data.pop(path, None)
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        """Hit and miss counters of the cache."""
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "size": len(self._data),
+            }
+
+
+class SecretConflict(Exception):
+    """Raised if secrets don't have their expected values."""
+
+    def __init__(self, conflicts: Dict[str, Dict[str, Optional[str]]]):
+        super().__init__(f"Secrets have changed: {', '.join(conflicts)}")
+        self.conflicts = conflicts
+
+
+class PathLocks:
+    """Serialise the writes to secret paths.
+
+    Threads of a process are serialised by a lock per path, the worker
+    processes of the server by an exclusive lock on a file per path. Next
+    to the lock file, each path has a generation that counts the writes to
+    the path.
+
+    Parameters
+    ----------
+    lock_dir: pathlib.Path
+        Directory holding the lock files.
+    """
+
+    def __init__(self, lock_dir: pathlib.Path = LOCK_DIR) -> None:
+        self.lock_dir = lock_dir
+        self._locks: Dict[str, threading.Lock] = defaultdict(threading.Lock)
+        self._lock = threading.Lock()
+
+    def _file(self, path: str, suffix: str = "") -> pathlib.Path:
+        name = hashlib.sha256(path.encode()).hexdigest()
+        return self.lock_dir / f"{name}{suffix}"
+
+    def generation(self, path: str) -> int:
+        """Get the number of writes to a path by all worker processes."""
+        try:
+            return int(self._file(path, ".gen").read_text() or 0)
+        except (OSError, ValueError):
+            return 0
+
+    def bump(self, path: str) -> None:
+        """Count a write to a path, the path has to be locked."""
+        gen_file = self._file(path, ".gen")
+        temp_file = self._file(
+            path, f".gen.{os.getpid()}.{threading.get_ident()}"
+        )
+        try:
+            temp_file.write_text(str(self.generation(path) + 1))
+            os.replace(temp_file, gen_file)
+        except OSError as error:
+            logger.warning("Could not update generation: %s", error)
+
+    @contextmanager
+    def _lock_path(self, path: str) -> Iterator[None]:
+        with self._lock:
+            lock = self._locks[path]
+        with lock:
+            try:
+                self.lock_dir.mkdir(exist_ok=True, parents=True)
+                lock_file = open(self._file(path), "a")
+            except OSError as error:
+                logger.warning("Could not create lock file: %s", error)
+                yield
+                return
+            with lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    @contextmanager
+    def __call__(self, paths: Iterable[str]) -> Iterator[None]:
+        """Lock the paths, always in the same order to avoid deadlocks."""
+        with ExitStack() as stack:
+            for path in sorted(set(paths)):
+                stack.enter_context(self._lock_path(path))
+            yield
+
+
 class VaultClient:
     """Interact with the client."""
 
@@ -121,37 +345,169 @@ class VaultClient:
     """The number of shares to split the master key into."""
     client = hvac.Client(
         url=VAULT_ADDR,
+        session=create_session(),
     )
     keys: KeyType = {"token": "", "keys": []}
 
     def __init__(self) -> None:
-        pass
+        self.locks = PathLocks()
+        self.cache = SecretCache(generation=self.locks.generation)
+        self._authenticated = False
+        self._auth_lock = threading.Lock()
+        self._pending: Dict[str, asyncio.Future[Optional[Dict[str, str]]]] = {}
 
     def _auth_vault(self) -> None:
-        if not self.client.is_authenticated():
-            keys = self.unseal()
-            self.client.token = keys.get("token")
+        """Authenticate, the state is only checked again after a 403."""
+        if self._authenticated:
+            return
+        with self._auth_lock:
+            if self._authenticated:
+                return
+            if not self.client.is_authenticated():
+                keys = self.unseal()
+                self.client.token = keys.get("token")
+            self._authenticated = bool(self.client.token)
+
+    def _call(self, action: str, **kwargs: Any) -> Any:
+        """Call a kv method, authenticate again if the token was rejected."""
+        for retry in (True, False):
+            self._auth_vault()
+            try:
+                return getattr(self.client.secrets.kv.v1, action)(**kwargs)
+            except (hvac.exceptions.Forbidden, hvac.exceptions.VaultDown):
+                self._authenticated = False
+                if not retry:
+                    raise
+
+    def _read(self, path: str) -> Dict[str, str]:
+        """Read a secret from the vault, bypassing the cache."""
+        try:
+            return cast(
+                Dict[str, str],
+                self._call("read_secret", path=path).get("data") or {},
+            )
+        except hvac.exceptions.InvalidPath:
+            return {}
+
+    def _write(self, path: str, secret: Dict[str, str]) -> None:
+        """Write a secret to the vault, the path has to be locked."""
+        self.cache.invalidate(path)
+        try:
+            self._call(
+                "create_or_update_secret",
+                path=path,
+                secret=secret,
+                method="POST",
+            )
+        finally:
+            self.locks.bump(path)
+
+    def batch(
+        self,
+        read: Iterable[str] = (),
+        update: Optional[Dict[str, Dict[str, str]]] = None,
+        expect: Optional[Dict[str, Dict[str, Optional[str]]]] = None,
+    ) -> Dict[str, Dict[str, str]]:
+        """Read and update several secret paths at once.
+
+        All paths are locked and read from the vault, bypassing the cache.
+        If any of the current secrets doesn't have its expected value, where
+        None means the key must not exist, nothing is written. If writing a
+        path fails, the paths that have already been written are restored.
+
+        Parameters
+        ----------
+        read: list[str], default: ()
+            Paths whose secrets are returned.
+        update: dict, default: None
+            Secrets that are merged into the existing secrets, by path.
+        expect: dict, default: None
+            The values the secrets must currently have, by path.
+
+        Returns
+        -------
+        dict: The secrets of all read, updated and expected paths.
+
+        Raises
+        ------
+        SecretConflict: If secrets don't have their expected values.
+        """
+        update, expect = update or {}, expect or {}
+        paths = {*read, *update, *expect}
+        with self.locks(paths):
+            current = {path: self._read(path) for path in paths}
+            conflicts = {
+                path: {key: current[path].get(key) for key in keys}
+                for path, keys in expect.items()
+                if any(current[path].get(k) != v for k, v in keys.items())
+            }
+            if conflicts:
+                raise SecretConflict(conflicts)
+            secrets = current.copy()
+            written: List[str] = []
+            try:
+                for path, secret in update.items():
+                    secrets[path] = {**current[path], **secret}
+                    if secrets[path] != current[path]:
+                        self._write(path, secrets[path])
+                        written.append(path)
+            except hvac.exceptions.VaultError:
+                for path in written:
+                    if current[path]:
+                        self._write(path, current[path])
+                    else:
+                        self.cache.invalidate(path)
+                        self._call("delete_secret", path=path)
+                        self.locks.bump(path)
+                raise
+            for path, secret in secrets.items():
+                if secret:
+                    self.cache.set(path, secret)
+            return secrets
 
     def update_secret(self, path: str, **secret: str) -> None:
         """Update or create a secret."""
-        self._auth_vault()
-        old_secret = self.get_secret(path) or {}
-        old_secret.update(secret)
-        self.client.secrets.kv.v1.create_or_update_secret(
-            path=path, secret=old_secret
-        )
+        self.batch(update={path: secret})
 
-    def get_secret(self, path: str) -> Optional[Dict[str, str]]:
-        """Get the secretes of a path."""
-        self._auth_vault()
+    def fetch_secret(self, path: str) -> Optional[Dict[str, str]]:
+        """Read the secrets of a path from the vault and cache them."""
+        generation = self.locks.generation(path)
         try:
-            return cast(
+            secret = cast(
                 Optional[Dict[str, str]],
-                self.client.secrets.kv.v1.read_secret(path).get("data"),
+                self._call("read_secret", path=path).get("data"),
             )
         except hvac.exceptions.VaultError:
             logger.warning("Could not find secret path: %s", path)
             return None
+        if secret is not None:
+            self.cache.set(path, secret, generation)
+        return secret
+
+    def get_secret(self, path: str) -> Optional[Dict[str, str]]:
+        """Get the secretes of a path."""
+        secret = self.cache.get(path)
+        if secret is not None:
+            return secret
+        return self.fetch_secret(path)
+
+    async def aget_secret(self, path: str) -> Optional[Dict[str, str]]:
+        """Get the secrets of a path without blocking the event loop.
+
+        Cached secrets are returned right away. Concurrent requests for
+        a secret that is not cached share a single vault request.
+        """
+        secret = self.cache.get(path)
+        if secret is not None:
+            return secret
+        if path not in self._pending:
+            future = asyncio.ensure_future(
+                run_in_pool(self.fetch_secret, path)
+            )
+            future.add_done_callback(lambda _: self._pending.pop(path, None))
+            self._pending[path] = future
+        secret = await asyncio.shield(self._pending[path])
+        return None if secret is None else secret.copy()
 
     @property
     def token(self) -> str:
@@ -229,9 +585,79 @@ Vault = VaultClient()
 @app.get("/vault/status", tags=["Secrets"])
 async def get_vault_status() -> JSONResponse:
     """Get the status of the vault."""
+    state = await run_in_pool(lambda: Vault.vault_state)
     return JSONResponse(
-        content={"status": Vault.vault_state, "version": VERSION}, status_code=200
+        content={
+            "status": state,
+            "version": VERSION,
+            "cache": Vault.cache.stats,
+        },
+        status_code=200,
+    )
+
+
+class SecretBatch(BaseModel):
+    """Secrets that are read or updated in one request."""
+
+    read: List[str] = Field(
+        default_factory=list,
+        description="Paths whose secrets are returned.",
+        examples=[["data"]],
     )
+    update: Dict[str, Dict[str, str]] = Field(
+        default_factory=dict,
+        description="Secrets merged into the existing secrets, by path.",
+        examples=[{"data": {"db.user": "freva"}}],
+    )
+    expect: Dict[str, Dict[str, Optional[str]]] = Field(
+        default_factory=dict,
+        description=(
+            "Current values the secrets must have for the update to be "
+            "applied, null if a key must not exist."
+        ),
+        examples=[{"data": {"db.user": None}}],
+    )
+
+
+@app.post("/vault/batch", tags=["Secrets"])
+async def batch_secrets(
+    batch: Annotated[SecretBatch, Body(description="The secrets.")],
+    admin_pw: Annotated[
+        Optional[str],
+        Header(
+            alias="password",
+            description="Give the pre defined admin password.",
+            examples="password",
+            tile="Password",
+        ),
+    ] = None,
+) -> JSONResponse:
+    """Read or update the secrets of several paths at once.
+
+    The update is only applied if all secrets have their expected values,
+    otherwise the current values of the conflicting secrets are returned.
+    """
+    if admin_pw != os.environ.get("ROOT_PW", ""):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Permission denied",
+        ) from None
+    try:
+        secrets = await run_in_pool(
+            Vault.batch, batch.read, batch.update, batch.expect
+        )
+    except SecretConflict as error:
+        return JSONResponse(
+            content={"message": str(error), "conflicts": error.conflicts},
+            status_code=status.HTTP_409_CONFLICT,
+        )
+    except hvac.exceptions.VaultError:
+        logger.warning("Could not update secrets of %s", list(batch.update))
+        raise HTTPException(
+            detail=random.choice(PHRASES),
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+        ) from None
+    return JSONResponse(content={"secrets": secrets}, status_code=200)
 
 
 @app.post("/vault/{path}", tags=["Secrets"])
@@ -276,7 +702,7 @@ async def update_secret(
             status_code=status.HTTP_204_NO_CONTENT,
         )
     try:
-        Vault.update_secret(path, **secrets)
+        await run_in_pool(Vault.update_secret, path, **secrets)
     except hvac.exceptions.VaultError:
         logger.warning("Could not add secrets %s to %s", path, secrets)
         raise HTTPException(
@@ -308,12 +734,13 @@ async def read_secret(
     """Read evaulation system secrets from the vault."""
     status_code = 400
     if len(public_key) != 128:  # This is not a checksum of a cert.
-        text = f"But the vault is {Vault.vault_state}"
+        state = await run_in_pool(lambda: Vault.vault_state)
+        text = f"But the vault is {state}"
         raise HTTPException(
             detail=f"{random.choice(PHRASES)} {text}", status_code=status_code
         ) from None
     # Get the information from the vault
-    data = Vault.get_secret(path)
+    data = await Vault.aget_secret(path)
     if data is not None:
         status_code = 200
     return JSONResponse(content=data or {}, status_code=status_code)
@@ -6,7 +6,7 @@ __metaclass__ = type
 
 DOCUMENTATION = """
     author: DRKZ CLINT
-    name: freva_deployment
+    name: deployment_plugin
     type: stdout
     short_description: YAML-ized Ansible screen output and write to log
     description:
@@ -15,32 +15,205 @@ DOCUMENTATION = """
         - Parse output to a log file at the same time.
     options:
         log_file:
-            default: temporary file
+            default: ""
             type: str
             description:
-                - Set the path to the log file.
+                - Set the path to the log file, a temporary file if not set.
             env:
-                - name: ANSIBLE_LOG_PATH
+                - name: DEPLOYMENT_LOG_PATH
+        log_compression:
+            default: none
+            type: str
+            description:
+                - Compress the log file, one of none, gzip or zstd. zstd
+                  needs the zstandard package and falls back to gzip.
+            env:
+                - name: DEPLOYMENT_LOG_COMPRESSION
+        log_max_stdout:
+            default: 0
+            type: int
+            description:
+                - Truncate stdout and stderr of task results that are
+                  longer than this number of characters, 0 disables
+                  truncation.
+            env:
+                - name: DEPLOYMENT_LOG_MAX_STDOUT
+        log_queue_size:
+            default: 1024
+            type: int
+            description:
+                - Number of results that are buffered before the task
+                  loop waits for the log writer.
+            env:
+                - name: DEPLOYMENT_LOG_QUEUE_SIZE
     extends_documentation_fragment:
       - default_callback
     requirements:
       - set as stdout in configuration
 """
+import atexit
+import gzip
 import json
-import os
+import queue
+import threading
+import time
+from pathlib import Path
 from tempfile import NamedTemporaryFile
-from typing import Optional
+from typing import IO, Any, Dict, List, Optional, Tuple, cast
 
 from ansible.constants import MODULE_NO_JSON
 from ansible.executor.task_result import TaskResult
-from ansible.plugins.callback import (
-    module_response_deepcopy,
-    strip_internal_keys,
-)
+from ansible.utils.display import Display
 from ansible_collections.community.general.plugins.callback.yaml import (
     CallbackModule as YamlCallback,
 )
 
+from freva_deployment.profiler import TaskTiming, write_profile
+
+display = Display()
+
+OUTPUT_KEYS = ("stdout", "stderr", "stdout_lines", "stderr_lines")
+"""Keys of module results whose content can be truncated."""
+
+
+def clean_result(result: Any, max_chars: int = 0) -> Any:
+    """Copy a (looped) task result for the log.
+
+    All dicts and lists are copied, like ``module_response_deepcopy`` does,
+    internal ansible keys are left out and, if ``max_chars`` is set, the
+    stdout and stderr entries are shortened. The result itself is not
+    modified, since ansible might still be using it.
+    """
+    if isinstance(result, list):
+        return [clean_result(item, max_chars) for item in result]
+    if not isinstance(result, dict):
+        return result
+    cleaned: Dict[Any, Any] = {}
+    for key, value in result.items():
+        if isinstance(key, str) and key.startswith("_ansible_"):
+            continue
+        if max_chars <= 0 or key not in OUTPUT_KEYS:
+            cleaned[key] = clean_result(value, max_chars)
+        elif isinstance(value, str) and len(value) > max_chars:
+            cleaned[key] = (
+                value[:max_chars]
+                + f"... [{len(value) - max_chars} characters truncated]"
+            )
+        elif isinstance(value, list):
+            chars = 0
+            lines: List[Any] = []
+            for line in value:
+                chars += len(str(line))
+                if chars > max_chars:
+                    lines.append(f"... [{len(value) - len(lines)} lines truncated]")
+                    break
+                lines.append(line)
+            cleaned[key] = lines
+        else:
+            cleaned[key] = value
+    return cleaned
+
+
+def open_log(path: str, compression: str) -> IO[bytes]:
+    """Open the log file for writing with the requested compression."""
+    compression = compression.lower().strip()
+    if compression == "zstd":
+        try:
+            import zstandard
+
+            return zstandard.ZstdCompressor().stream_writer(open(path, "wb"))
+        except ImportError:
+            display.warning(
+                "zstandard is not installed, compressing the log with gzip."
+            )
+            compression = "gzip"
+    if compression == "gzip":
+        return cast(IO[bytes], gzip.open(path, "wb", compresslevel=1))
+    return open(path, "wb")
+
+
+class LogWriter(threading.Thread):
+    """Background thread that serialises and writes task results.
+
+    The task loop puts cleaned copies of the results into a bounded queue,
+    the writer thread encodes the results and writes them in batches.
+
+    Parameters
+    ----------
+    path: str
+        Path to the log file.
+    compression: str, default: none
+        Compression of the log file: none, gzip or zstd.
+    max_stdout: int, default: 0
+        Maximum number of characters of stdout and stderr, 0 for no limit.
+    queue_size: int, default: 1024
+        Maximum number of results waiting to be written.
+    """
+
+    batch_size = 64
+
+    def __init__(
+        self,
+        path: str,
+        compression: str = "none",
+        max_stdout: int = 0,
+        queue_size: int = 1024,
+    ) -> None:
+        super().__init__(name="deployment-log-writer", daemon=True)
+        self.log_file = open_log(path, compression)
+        self.max_stdout = max_stdout
+        self.queue: queue.Queue[Optional[Dict[str, Any]]] = queue.Queue(
+            maxsize=max(queue_size, 1)
+        )
+        self._closed = False
+
+    @staticmethod
+    def _encode(entry: Dict[str, Any]) -> bytes:
+        return (json.dumps(entry, default=str) + "\n").encode()
+
+    def run(self) -> None:
+        running = True
+        while running:
+            batch: List[Optional[Dict[str, Any]]] = [self.queue.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            lines: List[bytes] = []
+            for entry in batch:
+                if entry is None:
+                    running = False
+                    break
+                try:
+                    lines.append(self._encode(entry))
+                except Exception as error:  # pragma: no cover
+                    display.warning(f"Could not write log entry: {error}")
+            self.log_file.write(b"".join(lines))
+            self.log_file.flush()
+        self.log_file.close()
+
+    def put(self, entry: Dict[str, Any]) -> None:
+        """Queue a cleaned copy of a result, waits if the queue is full.
+
+        The result is copied on the calling thread, because ansible keeps
+        modifying it after the callback returns.
+        """
+        if not self._closed:
+            entry["result"] = clean_result(entry["result"], self.max_stdout)
+            self.queue.put(entry)
+
+    def close(self) -> None:
+        """Write all pending results and close the log file."""
+        if self._closed:
+            return
+        self._closed = True
+        if self.is_alive():
+            self.queue.put(None)
+            self.join()
+        else:
+            self.log_file.close()
+
 
 class CallbackModule(YamlCallback):
     """
@@ -55,8 +228,12 @@ class CallbackModule(YamlCallback):
         Type of the callback plugin.
     CALLBACK_NAME : str
         Name of the callback plugin.
-    log_file : IO
-        File object for the log file.
+    log_writer : LogWriter
+        Background thread writing the log file, started once the options
+        are set.
+    timings : list[TaskTiming]
+        Start and end of every task on every host, written to a
+        ``.profile.json`` file next to the log once the run is done.
     """
 
     CALLBACK_VERSION = 2.0
@@ -72,33 +249,98 @@ class CallbackModule(YamlCallback):
         display : Optional[Display], optional
             Ansible display object for managing console output, by default None.
         """
+        self.log_writer: Optional[LogWriter] = None
+        self.profile_file: Optional[Path] = None
+        self.timings: List[TaskTiming] = []
+        self._task_starts: Dict[Tuple[str, str], float] = {}
+        self._play_name = ""
+        super().__init__()
+
+    def set_options(self, *args: Any, **kwargs: Any) -> None:
+        super().set_options(*args, **kwargs)
+        if self.log_writer is not None:
+            return
         log_file = (
-            os.getenv("DEPLOYMENT_LOG_PATH")
+            self.get_option("log_file")
             or NamedTemporaryFile(suffix=".log", delete=False).name
         )
-        self.log_file = open(log_file, "w")
-        super().__init__()
+        self.log_writer = LogWriter(
+            log_file,
+            compression=self.get_option("log_compression"),
+            max_stdout=self.get_option("log_max_stdout"),
+            queue_size=self.get_option("log_queue_size"),
+        )
+        self.log_writer.start()
+        atexit.register(self.log_writer.close)
+        self.profile_file = Path(log_file).with_suffix(".profile.json")
+
+    def _close_log(self) -> None:
+        if self.log_writer is not None:
+            self.log_writer.close()
+
+    def _record_timing(self, result: TaskResult, status: str) -> None:
+        """Remember how long the task of a result took on its host."""
+        task, host = result._task, result._host.get_name()
+        end = time.time()
+        role = task._role.get_name() if task._role else ""
+        self.timings.append(
+            TaskTiming(
+                task=result.task_name or task.get_name(),
+                role=role,
+                host=host,
+                status=status,
+                start=self._task_starts.pop((task._uuid, host), end),
+                end=end,
+                play=self._play_name,
+            )
+        )
+
+    def v2_playbook_on_play_start(self, play: Any) -> None:
+        self._play_name = play.get_name().strip()
+        super().v2_playbook_on_play_start(play)
+
+    def v2_runner_on_start(self, host: Any, task: Any) -> None:
+        self._task_starts[(task._uuid, host.get_name())] = time.time()
+        super().v2_runner_on_start(host, task)
+
+    def v2_runner_on_failed(
+        self, result: TaskResult, ignore_errors: bool = False
+    ) -> None:
+        self._record_timing(result, "failed")
+        super().v2_runner_on_failed(result, ignore_errors=ignore_errors)
+
+    def v2_runner_on_skipped(self, result: TaskResult) -> None:
+        self._record_timing(result, "skipped")
+        super().v2_runner_on_skipped(result)
+
+    def v2_runner_on_unreachable(self, result: TaskResult) -> None:
+        self._record_timing(result, "unreachable")
+        super().v2_runner_on_unreachable(result)
 
     def log_result(self, result: TaskResult) -> None:
         """
         Logs the result as a single-line JSON string to the log file.
 
+        The log writer copies and cleans the result right away and encodes
+        it in its own thread.
+
         Parameters
         ----------
         result : TaskResult
             Ansible task result object.
         """
-        dump = {
-            "task": result.task_name,
-            "result": strip_internal_keys(
-                module_response_deepcopy(result._result)
-            ),
-        }
-        single_line_json = json.dumps(dump).replace("\n", "").replace("\r", "")
-        self.log_file.write(single_line_json + "\n")
-        self.log_file.flush()
+        if self.log_writer is None:
+            return
+        self.log_writer.put(
+            {
+                "task": result.task_name,
+                "host": result._host.get_name(),
+                "result": result._result,
+            }
+        )
 
     def v2_runner_on_ok(self, result: TaskResult) -> None:
+        self._record_timing(result, "ok")
         if (
             result._task.action not in MODULE_NO_JSON
             or "ansible_job_id" not in result._result
@@ -114,8 +356,17 @@ class CallbackModule(YamlCallback):
             self.log_result(result)
         super().v2_runner_on_async_ok(result)
 
+    def v2_playbook_on_stats(self, stats: Any) -> None:
+        self._close_log()
+        try:
+            if self.profile_file is not None:
+                write_profile(self.profile_file, self.timings)
+        except OSError as error:  # pragma: no cover
+            display.warning(f"Could not write profile: {error}")
+        super().v2_playbook_on_stats(stats)
+
     def __del__(self) -> None:
         """
         Closes the log file when the callback plugin is destroyed.
         """
-        self.log_file.close()
+        self._close_log()
@@ -13,13 +13,11 @@ os.environ["ANSIBLE_COW_PATH"] = os.getenv(
 from rich_argparse import ArgumentDefaultsRichHelpFormatter
 
 from freva_deployment import __version__
-from freva_deployment.ui.deployment_tui import tui
-from freva_deployment.versions import VersionAction, display_versions
+from freva_deployment.versions import VersionAction
 
 from ._config import config_parser
 from ._deploy import BatchParser
-from ._deploy import cli as deploy
-from ._migrate import cli as migrate
+from ._fleet import FleetParser
 from ._migrate import create_parser as migrate_parser
 
 __all__ = ["deploy", "migrate"]
@@ -29,6 +27,13 @@ def __getattr__(name):
     return getattr(importlib.import_module(f"._{name}", __name__), "cli")
 
 
+def tui(args: argparse.Namespace) -> None:
+    """Run the Text User Interface (TUI), which is only imported on demand."""
+    from freva_deployment.ui.deployment_tui import tui as _tui
+
+    _tui(args)
+
+
 def main_cli(argv: Optional[List[str]] = None) -> None:
     """Construct command line argument parser."""
     app = argparse.ArgumentParser(
@@ -44,8 +49,8 @@ def main_cli(argv: Optional[List[str]] = None) -> None:
         "-V",
         "--version",
         action=VersionAction,
-        version="[b][red]%(prog)s[/red] {version}[/b]{services}".format(
-            version=__version__, services=display_versions()
+        version="[b][red]%(prog)s[/red] {version}[/b]%(services)s".format(
+            version=__version__
         ),
     )
     app.add_argument(
@@ -67,6 +72,18 @@ def main_cli(argv: Optional[List[str]] = None) -> None:
         )
     )
 
+    _ = FleetParser(
+        subparser.add_parser(
+            name="fleet",
+            help="Deploy many projects concurrently.",
+            description=(
+                "Deploy the services of many projects concurrently, "
+                "projects sharing a host are deployed one after another."
+            ),
+            formatter_class=ArgumentDefaultsRichHelpFormatter,
+        )
+    )
+
     config_parser(
         parser=subparser.add_parser(
             name="config",
@@ -20,7 +20,7 @@ def _get_config(parser: argparse.Namespace) -> None:
     error_console = Console(markup=True, force_terminal=True, stderr=True)
     std_console = Console(markup=True, force_terminal=True)
     try:
-        cfg = load_config(parser.config_file)
+        cfg = load_config(parser.config_file, read_only=True)
     except Exception as error:
         if parser.verbose > 0:
             raise
@@ -28,9 +28,9 @@ def _get_config(parser: argparse.Namespace) -> None:
         raise SystemExit(1)
     if not parser.keys:
         if parser.raw:
-            print(parser.config_file.read_text())
+            print(tomlkit.dumps(cfg))
         else:
-            std_console.print(parser.config_file.read_text())
+            std_console.print(tomlkit.dumps(cfg))
         return
     for key in parser.keys:
         section, _, value = key.partition(".")
@@ -11,11 +11,10 @@ from rich_argparse import ArgumentDefaultsRichHelpFormatter
 
 from freva_deployment import __version__
 
-from ..deploy import DeployFactory
 from ..error import DeploymentError
 from ..logger import set_log_level
 from ..utils import config_dir
-from ..versions import VersionAction, display_versions
+from ..versions import VersionAction
 
 
 class BatchParser:
@@ -84,6 +83,15 @@ class BatchParser:
             action="store_true",
             default=False,
         )
+        self.parser.add_argument(
+            "--local-ca",
+            help=(
+                "Issue all generated certificates by a certificate authority "
+                "of the deployment, implies --gen-keys."
+            ),
+            action="store_true",
+            default=False,
+        )
         self.parser.add_argument(
             "--skip-version-check",
             help="Skip the version check. Use with caution.",
@@ -94,8 +102,8 @@ class BatchParser:
             "-V",
             "--version",
             action=VersionAction,
-            version="[b][red]%(prog)s[/red] {version}[/b]{services}".format(
-                version=__version__, services=display_versions()
+            version="[b][red]%(prog)s[/red] {version}[/b]%(services)s".format(
+                version=__version__
             ),
         )
         self.parser.add_argument(
@@ -120,6 +128,71 @@ class BatchParser:
                 "set those ansible tasks ([i]tags[/i]) to be deployed."
             ),
         )
+        self.parser.add_argument(
+            "-j",
+            "--jobs",
+            type=int,
+            default=1,
+            help=(
+                "Number of plays that are deployed concurrently. Services "
+                "that don't depend on each other are deployed in parallel."
+            ),
+        )
+        self.parser.add_argument(
+            "--fast-transport",
+            help=(
+                "Reuse ssh connections and pipeline tasks through them. "
+                "Needs sudo without requiretty on the hosts."
+            ),
+            action="store_true",
+            default=False,
+        )
+        self.parser.add_argument(
+            "--fact-cache",
+            help=(
+                "Keep the gathered host facts in the user cache dir and "
+                "only gather them again once they are outdated."
+            ),
+            action="store_true",
+            default=False,
+        )
+        self.parser.add_argument(
+            "--skip-preflight",
+            help=(
+                "Don't check the ssh and sudo access of all hosts before "
+                "the deployment."
+            ),
+            action="store_true",
+            default=False,
+        )
+        self.parser.add_argument(
+            "--profile",
+            help=(
+                "Display the slowest tasks and the time spent in each role "
+                "and on each host after the deployment."
+            ),
+            action="store_true",
+            default=False,
+        )
+        self.parser.add_argument(
+            "--trace",
+            help=(
+                "Write a timeline of all tasks on all hosts that can be "
+                "opened with Perfetto or chrome://tracing."
+            ),
+            action="store_true",
+            default=False,
+        )
+        self.parser.add_argument(
+            "-f",
+            "--force",
+            help=(
+                "Deploy all selected services, even those whose "
+                "configuration didn't change since their last deployment."
+            ),
+            action="store_true",
+            default=False,
+        )
         self.parser.add_argument(
             "--cowsay",
             action="store_true",
@@ -134,6 +207,8 @@ class BatchParser:
     @staticmethod
     def run_cli(args: argparse.Namespace) -> None:
         """Run the command line interface."""
+        from ..deploy import DeployFactory
+
         set_log_level(args.verbose)
         steps = [s.replace("-", "_") for s in args.steps]
         if args.tags:
@@ -143,6 +218,7 @@ class BatchParser:
             config_file=args.config,
             local_debug=args.local,
             gen_keys=args.gen_keys,
+            local_ca=args.local_ca,
             _cowsay=args.cowsay,
         ) as DF:
             try:
@@ -152,6 +228,13 @@ class BatchParser:
                     ssh_port=args.ssh_port,
                     skip_version_check=args.skip_version_check,
                     tags=args.tags or None,
+                    jobs=args.jobs,
+                    fast_transport=args.fast_transport,
+                    fact_cache=args.fact_cache,
+                    force=args.force,
+                    skip_preflight=args.skip_preflight,
+                    profile=args.profile,
+                    trace=args.trace,
                 )
             except KeyboardInterrupt:
                 raise SystemExit(130)
@@ -0,0 +1,139 @@
+"""Command line interface for deploying many projects."""
+
+from __future__ import annotations
+
+import argparse
+import os
+from pathlib import Path
+from typing import List, Optional
+
+from rich.console import Console
+from rich.prompt import Prompt
+from rich_argparse import ArgumentDefaultsRichHelpFormatter
+
+from ..error import DeploymentError
+from ..logger import set_log_level
+from ._deploy import BatchParser
+
+
+class FleetParser(BatchParser):
+    """Command line interface for deploying many projects concurrently."""
+
+    fleet_options = ("config", "projects", "max_per_host", "log_dir")
+    """Options that are not passed on to the deployment of a project."""
+
+    def __init__(
+        self,
+        parser: Optional[argparse.ArgumentParser] = None,
+        epilog: str = "",
+    ) -> None:
+        super().__init__(
+            parser
+            or argparse.ArgumentParser(
+                prog="deploy-freva-fleet",
+                description="Deploy the services of many projects.",
+                formatter_class=ArgumentDefaultsRichHelpFormatter,
+                epilog=epilog,
+            ),
+            epilog=epilog,
+        )
+        for action in self.parser._actions:
+            if action.dest == "config":
+                action.nargs = "+"
+                action.required = True
+                action.default = None
+                action.help = "Path to the ansible inventory of each project."
+        self.parser.add_argument(
+            "-p",
+            "--projects",
+            type=int,
+            default=2,
+            help="Number of projects that are deployed concurrently.",
+        )
+        self.parser.add_argument(
+            "--max-per-host",
+            type=int,
+            default=1,
+            help="Number of projects that are deployed on one host at a time.",
+        )
+        self.parser.add_argument(
+            "--log-dir",
+            type=Path,
+            default=None,
+            help="Directory for the deployment logs of each project.",
+        )
+        self.parser.set_defaults(cli=self.run_fleet)
+
+    def deploy_args(self, args: argparse.Namespace) -> List[str]:
+        """The command line arguments for the deployment of a project."""
+        argv: List[str] = []
+        for action in self.parser._actions:
+            if (
+                not action.option_strings
+                or action.dest in self.fleet_options
+                or action.default == argparse.SUPPRESS
+            ):
+                continue
+            value = getattr(args, action.dest, action.default)
+            if value == action.default or value is None:
+                continue
+            flag = max(action.option_strings, key=len)
+            if isinstance(value, bool):
+                argv.append(flag)
+            elif action.nargs == 0:
+                argv += [flag] * int(value)
+            elif isinstance(value, list):
+                argv += [flag, *map(str, value)]
+            else:
+                argv += [flag, str(value)]
+        return argv
+
+    def run_fleet(self, args: argparse.Namespace) -> None:
+        """Run the command line interface."""
+        from ..fleet import Fleet
+        from ..utils import get_passwd
+
+        set_log_level(args.verbose)
+        console = Console(markup=True, force_terminal=True)
+        fleet = Fleet(
+            args.config,
+            max_jobs=args.projects,
+            max_per_host=args.max_per_host,
+            log_dir=args.log_dir,
+        )
+        envvars = {}
+        if args.ask_pass and not os.getenv("ANSIBLE_SSH_PASSWORD"):
+            envvars["ANSIBLE_SSH_PASSWORD"] = Prompt.ask(
+                "[green]Give the [b]ssh[/b] password for remote login[/green]",
+                password=True,
+            )
+        if not args.local and not os.getenv("ANSIBLE_BECOME_PASSWORD"):
+            envvars["ANSIBLE_BECOME_PASSWORD"] = Prompt.ask(
+                "[green]Give the password elevating user privilege "
+                "([b]sudo[/b]), defaults to ssh password[/green]",
+                password=True,
+                default=envvars.get("ANSIBLE_SSH_PASSWORD", ""),
+                show_default=False,
+            )
+        master_passwords = {}
+        if not os.getenv("MASTER_PASSWD"):
+            for member in fleet.members:
+                console.rule(f"[b]{member.project_name}[/b]")
+                master_passwords[member.project_name] = get_passwd()
+        try:
+            fleet.run(
+                self.deploy_args(args),
+                envvars=envvars,
+                master_passwords=master_passwords,
+            )
+        except KeyboardInterrupt:
+            raise SystemExit(130)
+        except DeploymentError:
+            raise SystemExit(1)
+
+
+def cli(argv: Optional[List[str]] = None) -> None:
+    """Deploy many projects."""
+    cli = FleetParser()
+    args = cli.parser.parse_args(argv)
+    args.cli(args)
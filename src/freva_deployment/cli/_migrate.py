@@ -13,7 +13,6 @@ from subprocess import PIPE, CalledProcessError, run
 from tempfile import NamedTemporaryFile, TemporaryDirectory
 from typing import Optional, TextIO, cast
 
-import pymysql
 import toml
 from rich_argparse import ArgumentDefaultsRichHelpFormatter
 
@@ -83,6 +82,8 @@ def _get_python_path_from_env() -> Path:
 
 
 def _add_new_db(db_config: dict[str, str], dump_file: str) -> None:
+    import pymysql
+
     dump_cmd = (
         f"mariadb --ssl=0 -h {db_config['db.host']} -u {db_config['db.user']} "
         f"-p'{db_config['db.passwd']}' -P{db_config['db.port']} < {dump_file}"
@@ -2,6 +2,7 @@
 
 from __future__ import annotations
 
+import hashlib
 import json
 import logging
 import os
@@ -31,10 +32,20 @@ from typing_extensions import NotRequired, TypedDict
 import freva_deployment.callback_plugins
 from freva_deployment import AUX_URL, FREVA_PYTHON_VERSION, __version__
 
-from .error import ConfigurationError, handled_exception
-from .keys import RandomKeys
+from .digest import play_digests
+from .error import ConfigurationError, DeploymentError, handled_exception
+from .keys import KeyStore, LocalCA, RandomKeys
 from .logger import logger
-from .runner import RunnerDir
+from .playbook_index import PlaybookIndex
+from .preflight import Preflight, ProbeTarget
+from .profiler import (
+    profile_report,
+    summarise,
+    write_profile,
+    write_trace,
+)
+from .runner import SSH_MULTIPLEX_ARGS, RunnerDir, ssh_handshakes_saved
+from .scheduler import PlayScheduler
 from .utils import (
     RichConsole,
     asset_dir,
@@ -61,6 +72,52 @@ LOCAL_DEBUG_MSG = (
     "You can omit the [i]--debug[/i] flag for a real deploymet."
 )
 
+GENERATED_VARS = (
+    "db_passwd",
+    "vault_passwd",
+    "freva_rest_db_passwd",
+    "freva_rest_db_user",
+    "mongodb_server_db_passwd",
+    "mongodb_server_db_user",
+    "web_redis_username",
+    "web_redis_password",
+    "redis_information",
+    "data_portal_scheduler_information",
+    "data_portal_hosts_information",
+)
+"""Inventory variables whose values are generated anew for every deployment.
+
+The services keep the credentials they were set up with, hence these
+variables don't decide whether a service has to be deployed again. Plays
+that share these credentials are listed in ``LINKED_PLAYS``.
+"""
+
+LINKED_PLAYS = (
+    ("Deploy Database", "Deploy Vault"),
+    (
+        "Setup mongodb server",
+        "Deploy Freva Rest API",
+        "Add monogDB secrets to vault",
+    ),
+)
+"""Plays that are only skipped together.
+
+The plays of a group set up the same generated credentials, a play that is
+deployed again would hand out credentials the skipped plays never received.
+"""
+
+EXTERNAL_HOST_KEYS = ("chatbot_host",)
+"""Host keys of services the deployment doesn't connect to."""
+
+
+def get_eval_config_template() -> Path:
+    """The template of the evaluation_system.conf, downloaded if missing."""
+    cfg_file = asset_dir / "config" / "evaluation_system.conf.tmpl"
+    if not cfg_file.is_file():
+        cfg_file.parent.mkdir(exist_ok=True, parents=True)
+        urlretrieve(AUX_URL, filename=str(cfg_file))
+    return cfg_file
+
 
 class ConfigType(TypedDict):
     """Define the type of the yaml config dict."""
@@ -135,6 +192,9 @@ class DeployFactory:
         Run deployment only on local machine, debug mode.
     gen_keys: bool, default: False
         Create new set of certificates, if they don't already exist.
+    local_ca: bool, default: False
+        Issue all generated certificates by a certificate authority of the
+        deployment instead of self-signing them.
 
     Examples
     --------
@@ -151,6 +211,15 @@ class DeployFactory:
         "web",
     )
     _steps_with_cert: tuple[str, ...] = ("core", "db", "web")
+    prep_graph: dict[str, tuple[str, ...]] = {
+        "core": (),
+        "vault": (),
+        "data_loader": (),
+        "web": ("core", "vault"),
+        "db": ("vault", "web"),
+        "freva_rest": ("data_loader", "web"),
+    }
+    """The config sections and the sections their preparation needs."""
 
     @handled_exception
     def __init__(
@@ -159,13 +228,16 @@ class DeployFactory:
         config_file: Path | str | None = None,
         local_debug: bool = False,
         gen_keys: bool = False,
+        local_ca: bool = False,
         _cowsay: bool = False,
     ) -> None:
         self.passwords: dict[str, str] = {}
         self._no_cowsay = str(int(_cowsay is False))
-        self.gen_keys = gen_keys or local_debug
+        self.gen_keys = gen_keys or local_debug or local_ca
         self.local_debug = local_debug
         self._config_keys: list[str] = []
+        self._prepared: set[str] = set()
+        self._user_keys: dict[str, list[str]] = {}
         self._master_pass: str = ""
         self._td: RunnerDir = RunnerDir()
         self.eval_conf_file: Path = self._td.parent_dir / "evaluation_system.conf"
@@ -180,10 +252,15 @@ class DeployFactory:
         self.project_name = self.cfg.pop("project_name", None)
         if not self.project_name:
             raise ConfigurationError("You must set a project name") from None
-        self._random_key = RandomKeys(
-            self.project_name,
-            self.cfg.get("web", {}).get("web_host", "localhost"),
-        )
+        self.local_ca: LocalCA | None = None
+        web_host = self.cfg.get("web", {}).get("web_host", "localhost")
+        if local_ca:
+            self.local_ca = LocalCA(self.project_name)
+            self._random_key = self.local_ca.issue(web_host, self.project_name)
+        else:
+            self._random_key = RandomKeys(
+                self.project_name, web_host, store=KeyStore.from_env()
+            )
         self.current_step = ""
         self._check_steps_()
 
@@ -193,15 +270,33 @@ class DeployFactory:
         old_master = self._master_pass
         self._master_pass = old_master or "foo"
         not_in_use = set(["db", "freva_rest", "web", "core"]) - set(self.steps)
-        for step in self.steps:
-            getattr(self, f"_prep_{step.replace('-', '_')}")()
+        self.prepare(*self.steps)
         for step in not_in_use:
             try:
-                getattr(self, f"_prep_{step.replace('-', '_')}")()
+                self.prepare(step)
             except ConfigurationError as error:
                 logger.warning("Some of your config isn't valid:\n%s", error)
         self._master_pass = old_master
 
+    def prepare(self, *steps: str) -> None:
+        """Prepare the config of deployment steps.
+
+        The config of each step, and of the steps it needs, is only
+        prepared once per factory.
+
+        Parameters
+        ----------
+        steps: str
+            The steps that are prepared.
+        """
+        for step in steps:
+            step = step.replace("-", "_")
+            if step in self._prepared:
+                continue
+            self.prepare(*self.prep_graph.get(step, ()))
+            getattr(self, f"_prep_{step}")()
+            self._prepared.add(step)
+
     @property
     def master_pass(self) -> str:
         """Define the master password."""
@@ -273,8 +368,6 @@ class DeployFactory:
             self.cfg["db"]["host"] = host
         self.cfg["db"].setdefault("port", "3306")
         self.cfg["db"]["email"] = self.cfg["web"].get("contacts", "")
-        self._prep_vault()
-        self._prep_web(False)
 
     def _prep_data_loader(self) -> None:
         """Prepare the data-loader."""
@@ -324,6 +417,7 @@ class DeployFactory:
             redis_port,
             scheduler_host,
             scheduler_port or "40000",
+            ca=self.local_ca,
         )
         redis_information["passwd"] = self._create_random_passwd(30, 10)
         redis_information_enc = b64encode(
@@ -374,10 +468,9 @@ class DeployFactory:
             "information": redis_information_enc,
         }
 
-    def _prep_freva_rest(self, prep_web=True) -> None:
+    def _prep_freva_rest(self) -> None:
         """prepare the freva_rest service."""
         self._config_keys.append("freva_rest")
-        self._prep_data_loader()
         self.cfg["freva_rest"].setdefault("ansible_become_user", "root")
         self.cfg["freva_rest"]["root_passwd"] = self.master_pass
         self.cfg["freva_rest"]["db_passwd"] = self._create_random_passwd(30, 10)
@@ -422,8 +515,6 @@ class DeployFactory:
                 token_claims_str
             )
         self.cfg["freva_rest"]["services"] = "-s " + " -s ".join(services)
-        if prep_web:
-            self._prep_web(False)
         for key in ("mongodb_server", "search_server"):
             self._config_keys.append(key)
             self.cfg[key] = deepcopy(self.cfg["freva_rest"])
@@ -463,10 +554,13 @@ class DeployFactory:
             )
         if not scheduler_output_dir:
             scheduler_output_dir = str(Path(base_dir_location) / "share")
-        elif Path(scheduler_output_dir).parts[-1] != scheduler_system:
+        if Path(scheduler_output_dir).parts[-1] != scheduler_system:
             scheduler_output_dir = Path(scheduler_output_dir) / scheduler_system
         self.cfg["core"]["scheduler_output_dir"] = str(scheduler_output_dir)
         self.cfg["core"]["keyfile"] = self.public_key_file
+        self.cfg["core"]["ca_file"] = (
+            self.local_ca.certificate_file if self.local_ca else ""
+        )
         self.cfg["core"]["git_url"] = "https://github.com/FREVA-CLINT/freva.git"
 
     def _prep_web(self, ask_pass: bool = True) -> None:
@@ -476,10 +570,9 @@ class DeployFactory:
         for key in "oidc_url", "oidc_client", "oidc_client_secret":
             self.cfg["web"][key] = self.cfg["freva_rest"].get("oidc_url", "")
         self.cfg["web"].setdefault("ansible_become_user", "root")
-        self._prep_core()
         freva_rest_host = (
             f'{self.cfg["freva_rest"]["freva_rest_host"]}:'
-            f'{self.cfg["freva_rest"]["freva_rest_port"]}'
+            f'{self.cfg["freva_rest"].get("freva_rest_port") or 7777}'
         )
         self.cfg["web"]["freva_rest_host"] = freva_rest_host
         self.cfg["web"].setdefault("deploy_web_server", True)
@@ -509,9 +602,9 @@ class DeployFactory:
             ]
         allowed_hosts.append(self.cfg["web"]["web_host"])
         allowed_hosts.append(f"{self.project_name}-httpd")
-        self.cfg["web"]["allowed_hosts"] = [
+        self.cfg["web"]["allowed_hosts"] = sorted(
             s.strip() for s in set(allowed_hosts) if s.strip()
-        ]
+        )
         self.cfg["web"].setdefault("main_color", "Tomato")
         _webserver_items = {
             "institution_logo": self.cfg["web"].get("institution_logo", ""),
@@ -561,7 +654,7 @@ class DeployFactory:
                 self.cfg["web"]["csrf_trusted_origins"].append(
                     f"https://{trusted_origin.path}"
                 )
-        self.cfg["web"]["csrf_trusted_origins"] = list(
+        self.cfg["web"]["csrf_trusted_origins"] = sorted(
             set(self.cfg["web"]["csrf_trusted_origins"])
         )
         self.cfg["web"]["freva_bin"] = os.path.join(
@@ -569,7 +662,6 @@ class DeployFactory:
         )
         for key in ("core", "web"):
             self.cfg[key]["config_toml_file"] = str(self.web_conf_file)
-        self._prep_vault()
         self.cfg["vault"]["ansible_python_interpreter"] = self.cfg["db"].get(
             "ansible_python_interpreter", "/usr/bin/python3"
         )
@@ -668,6 +760,9 @@ class DeployFactory:
         }
         try:
             config = dict(load_config(self._inv_tmpl, convert=True).items())
+            self._user_keys = {
+                k: list(v) for (k, v) in config.items() if isinstance(v, dict)
+            }
             for dest, source in mapper.items():
                 host = (
                     config[source].get(f"{dest}_host")
@@ -716,6 +811,171 @@ class DeployFactory:
                     return True
         return False
 
+    @property
+    def hosts(self) -> list[str]:
+        """All hosts the deployment is going to connect to."""
+        hosts: list[str] = []
+        for section in self.cfg.values():
+            for host in self._section_hosts(section):
+                if host not in hosts:
+                    hosts.append(host)
+        return hosts
+
+    @staticmethod
+    def _section_hosts(
+        section: Any, exclude: tuple[str, ...] = ()
+    ) -> list[str]:
+        """Get the hosts that are set in a config section."""
+        hosts: list[str] = []
+        if not isinstance(section, dict):
+            return hosts
+        for key, value in section.items():
+            if not isinstance(value, str) or not key.endswith(
+                ("_host", "_hosts")
+            ):
+                continue
+            if key in exclude:
+                continue
+            for host in value.split(","):
+                host = host.strip().rpartition("://")[-1].partition(":")[0]
+                if host and host not in hosts:
+                    hosts.append(host)
+        return hosts
+
+    @property
+    def host_users(self) -> dict[str, set[tuple[str, str]]]:
+        """The login and become users the services of each host use.
+
+        The core library is left out, because its host gets its own
+        inventory entry if it is shared with other services.
+        """
+        users: dict[str, set[tuple[str, str]]] = {}
+        for step, section in self.cfg.items():
+            if step == "core" or not isinstance(section, dict):
+                continue
+            user = str(
+                section.get("ansible_user")
+                or os.getenv("ANSIBLE_USER")
+                or getuser()
+            )
+            become_user = str(section.get("ansible_become_user", "root") or "")
+            for host in self._section_hosts(section):
+                users.setdefault(host, set()).add((user, become_user))
+        return users
+
+    @staticmethod
+    def _play_groups(tags: list[str]) -> list[str]:
+        """The host groups of the deployment plays that have the given tags.
+
+        Plays that run on several groups, like the pre-pull of the images,
+        only contact the hosts of the other plays and are left out.
+        """
+        main_playbook = yaml.safe_load(
+            (asset_dir / "playbooks" / "main-deployment.yml").read_text()
+        )
+        groups: list[str] = []
+        for entry in main_playbook:
+            for tag in entry.get("tags", []):
+                if tag in tags and entry["hosts"] not in groups:
+                    groups.append(entry["hosts"])
+        return groups
+
+    def _inventory_hosts(self, step: str) -> str:
+        """The hosts of a config section in the ansible inventory."""
+        section = self.cfg.get(step, {})
+        return section.get(f"{step}_host") or section.get(step) or ""
+
+    def preflight_targets(
+        self, tags: Optional[list[str]] = None
+    ) -> list[ProbeTarget]:
+        """The hosts and users that are probed before the deployment.
+
+        Only the hosts the deployment connects to via ssh are probed, those
+        are the inventory hosts of the plays that are run.
+
+        Parameters
+        ----------
+        tags: list[str], default: None
+            The tags of the plays that are run, the steps if not given.
+        """
+        targets: dict[tuple[str, str, str], list[str]] = {}
+        for group in self._play_groups(
+            list(tags or self.steps) or list(self.step_order)
+        ):
+            step = group.replace("-", "_")
+            section = self.cfg.get(step)
+            if step not in self._config_keys or not isinstance(section, dict):
+                continue
+            user = str(
+                section.get("ansible_user")
+                or os.getenv("ANSIBLE_USER")
+                or getuser()
+            )
+            become_user = str(
+                section.get(
+                    "ansible_become_user", "" if step == "core" else "root"
+                )
+                or ""
+            )
+            for host in self._inventory_hosts(step).split(","):
+                host = host.strip().rpartition("://")[-1].partition(":")[0]
+                if not host:
+                    continue
+                targets.setdefault((host, user, become_user), [])
+                targets[(host, user, become_user)].append(step)
+        return [
+            ProbeTarget(*key, services=tuple(services))
+            for key, services in targets.items()
+        ]
+
+    def _preflight(
+        self,
+        ssh_port: int,
+        tags: Optional[list[str]] = None,
+        control_path_dir: Optional[Path] = None,
+    ) -> None:
+        """Probe all hosts and abort if any of them can't be used."""
+        results = Preflight(
+            self.preflight_targets(tags),
+            port=ssh_port,
+            passwords=self.passwords,
+            control_path_dir=control_path_dir,
+        ).report(RichConsole)
+        failed = sorted({r.target.host for r in results if not r.ok})
+        if failed:
+            raise DeploymentError(
+                f"Pre-flight check failed for: {', '.join(failed)}. "
+                "Fix the connection or use --skip-preflight."
+            )
+
+    def _fact_cache_config(self) -> dict[str, str]:
+        """Settings of the persistent fact cache of the deployment.
+
+        Facts like ``ansible_env.HOME`` depend on the user that gathers
+        them. The cache is therefore kept per combination of hosts and
+        users, and hosts that are deployed with different users gather
+        their facts for every play.
+        """
+        host_users = self.host_users
+        digest = hashlib.sha256(
+            json.dumps(
+                {host: sorted(users) for host, users in host_users.items()},
+                sort_keys=True,
+            ).encode()
+        ).hexdigest()[:16]
+        mixed = sorted(h for h, users in host_users.items() if len(users) > 1)
+        if mixed:
+            logger.warning(
+                "Facts of %s are gathered for every play, because the "
+                "services on these hosts are deployed by different users.",
+                ", ".join(mixed),
+            )
+        return self._td.fact_cache_config(
+            Path(appdirs.user_cache_dir("freva-deployment")) / "facts" / digest,
+            timeout=int(os.getenv("FREVA_DEPLOYMENT_FACT_CACHE_TTL", "86400")),
+            smart=not mixed,
+        )
+
     @property
     def _empty_ok(self) -> list[str]:
         """Define all keys that can be empty."""
@@ -803,32 +1063,26 @@ class DeployFactory:
         self._steps = list(new_steps)
         logger.info("Parsing configurations")
         self._check_config()
-        _ = [getattr(self, f"_prep_{step}")() for step in self.steps]
-        config: dict[str, ConfigType] = {}
-        playbooks = "\n".join(
-            [
-                a.read_text()
-                for a in (asset_dir / "playbooks").rglob("*.*")
-                if a.is_file()
-            ]
-        )
-        main_playbook = yaml.safe_load(
-            (asset_dir / "playbooks" / "main-deployment.yml").read_text()
+        playbook_vars = PlaybookIndex(asset_dir / "playbooks")
+        config_tmpl = tomlkit.loads((self.aux_dir / "inventory.toml").read_text())
+        playbook_vars.check_keys(
+            self._user_keys,
+            {k: v for (k, v) in config_tmpl.items() if isinstance(v, dict)},
         )
-        tags, hosts = [], []
-        for entry in main_playbook:
-            for tag in entry.get("tags", []):
-                if tag in self.steps + ["vault"]:
-                    tags.append(entry["hosts"])
+        self.prepare(*self.steps)
+        for step in set(self._config_keys):
+            # The config has been checked without the master password.
+            if "root_passwd" in self.cfg.get(step, {}):
+                self.cfg[step]["root_passwd"] = self.master_pass
+        config: dict[str, ConfigType] = {}
+        tags = self._play_groups(self.steps + ["vault"])
+        hosts: list[str] = []
         no_prepend = ("root_passwd", "deployment_method")
         for step in set(self._config_keys):
             config[step] = {}
-            if self.cfg.get(step, {}).get(f"{step}_host"):
-                config[step]["hosts"] = self.cfg[step][f"{step}_host"]
-            elif self.cfg.get(step, {}).get(step):
-                config[step]["hosts"] = self.cfg[step][step]
-            else:
+            if not self._inventory_hosts(step):
                 continue
+            config[step]["hosts"] = self._inventory_hosts(step)
             if step != "core" and step in config:
                 hosts.append(config[step]["hosts"])
             config[step]["vars"] = {}
@@ -837,7 +1091,7 @@ class DeployFactory:
                     new_key = key
                 else:
                     new_key = f"{step.replace('-', '_')}_{key}"
-                if new_key in playbooks:
+                if new_key in playbook_vars:
                     config[step]["vars"][new_key] = value
             config[step]["vars"]["project_name"] = self.project_name
             config[step]["vars"][f"{step}_admin_user"] = self.cfg[step].get(
@@ -923,12 +1177,7 @@ class DeployFactory:
             ("core", "scheduler_output_dir"),
             ("core", "scheduler_system"),
         )
-        cfg_file = asset_dir / "config" / "evaluation_system.conf.tmpl"
-        if not cfg_file.is_file():
-            cfg_file.parent.mkdir(exist_ok=True, parents=True)
-            urlretrieve(AUX_URL, filename=str(cfg_file))
-
-        with cfg_file.open() as f_obj:
+        with get_eval_config_template().open() as f_obj:
             lines = f_obj.readlines()
             for num, line in enumerate(lines):
                 if line.startswith("project_name"):
@@ -970,7 +1219,11 @@ class DeployFactory:
             passwords[ssh_key] = Prompt.ask(
                 f"[green]{ssh_pass_msg}[/green]", password=True
             )
-        if not passwords[sudo_key] and self.ask_become_password:
+        if (
+            not passwords[sudo_key]
+            and self.ask_become_password
+            and sys.stdin.isatty()
+        ):
             passwords[sudo_key] = Prompt.ask(
                 f"[green]{sudo_pass_msg}[/green]", password=True
             )
@@ -986,6 +1239,13 @@ class DeployFactory:
         ssh_port: int = 22,
         skip_version_check: bool = False,
         tags: Optional[list[str]] = None,
+        jobs: int = 1,
+        fast_transport: bool = False,
+        fact_cache: bool = False,
+        force: bool = False,
+        skip_preflight: bool = False,
+        profile: bool = False,
+        trace: bool = False,
     ) -> None:
         """Play the ansible playbook.
 
@@ -1003,7 +1263,31 @@ class DeployFactory:
         tags: list[str], default: None
             Instead of running the steps, fine grain the deployment using this
             specific tasks.
+        jobs: int, default: 1
+            Number of plays that are allowed to run concurrently. Plays that
+            don't depend on each other are deployed in parallel if set to a
+            value larger than 1.
+        fast_transport: bool, default: False
+            Reuse ssh connections and pipeline the ansible tasks through
+            them. This needs sudo to be configured without ``requiretty``
+            on the hosts.
+        fact_cache: bool, default: False
+            Keep the gathered facts of the hosts in the user cache dir and
+            only gather a minimal set of facts.
+        force: bool, default: False
+            Deploy all services, even those whose configuration didn't
+            change since their last deployment.
+        skip_preflight: bool, default: False
+            Don't check the ssh and sudo access of all hosts before the
+            deployment.
+        profile: bool, default: False
+            Display the slowest tasks and the time spent in each role and
+            on each host once the deployment is done.
+        trace: bool, default: False
+            Write a timeline of all tasks on all hosts that can be opened
+            with Perfetto or chrome://tracing.
         """
+        self._play_started = time.strftime("%Y%m%dT%H%M%S")
         try:
             self._play(
                 ask_pass=ask_pass,
@@ -1011,11 +1295,36 @@ class DeployFactory:
                 ssh_port=ssh_port,
                 skip_version_check=skip_version_check,
                 tags=tags,
+                jobs=jobs,
+                fast_transport=fast_transport,
+                fact_cache=fact_cache,
+                force=force,
+                skip_preflight=skip_preflight,
             )
         except KeyboardInterrupt as error:
             if str(error):
                 pprint(f" [red][ERROR]: {error}[/]", file=sys.stderr)
             raise KeyboardInterrupt() from None
+        finally:
+            if profile and self._td.timings:
+                self._report_profile()
+            if trace and self._td.timings:
+                trace_file = self._timing_file("trace")
+                write_trace(trace_file, self._td.timings)
+                logger.info("Task timeline was written to %s", trace_file)
+
+    def _timing_file(self, kind: str) -> Path:
+        """Path of a new file for the task timings in the user log dir."""
+        return Path(appdirs.user_log_dir("freva-deployment")) / (
+            f"{self.project_name}-{self._play_started}.{kind}.json"
+        )
+
+    def _report_profile(self) -> None:
+        """Display the task timings and keep them in the user log dir."""
+        RichConsole.print(profile_report(summarise(self._td.timings)))
+        profile_file = self._timing_file("profile")
+        write_profile(profile_file, self._td.timings)
+        logger.info("Task timings were written to %s", profile_file)
 
     def get_steps_from_versions(
         self,
@@ -1078,7 +1387,8 @@ class DeployFactory:
         core_host: Optional[str] = config.get("core", {}).get("hosts")
         if core_host and core_host in hosts:
             config["core"]["hosts"] = gethostbyname(core_host) or ""
-        result = self._td.run_ansible_playbook(
+        versions = {}
+        for event in self._td.stream_ansible_playbook(
             playbook=playbook,
             inventory=config,
             envvars=envvars,
@@ -1087,15 +1397,11 @@ class DeployFactory:
             verbosity=verbosity,
             hide_output=True,
             text="Getting versions of micro-services ...",
-        )
-        versions = {}
-        for line in result.splitlines():
-            jline = json.loads(line)
-            if "msg" in jline["result"] and jline["task"].lower().startswith(
-                "display"
-            ):
-                service = jline["task"].split()[1].lower()
-                version = jline["result"]["msg"].strip()
+            task="display *",
+        ):
+            if "msg" in event.result:
+                service = event.task.split()[1].lower()
+                version = event.result["msg"].strip()
                 versions[service.strip()] = version.strip()
         logger.debug("Detected versions: %s", versions)
         additional_steps = get_steps_from_versions(versions)
@@ -1108,6 +1414,11 @@ class DeployFactory:
         ssh_port: int = 22,
         skip_version_check: bool = False,
         tags: Optional[list[str]] = None,
+        jobs: int = 1,
+        fast_transport: bool = False,
+        fact_cache: bool = False,
+        force: bool = False,
+        skip_preflight: bool = False,
     ) -> None:
         plugin_path = Path(freva_deployment.callback_plugins.__file__).parent
         envvars: dict[str, str] = {
@@ -1119,7 +1430,28 @@ class DeployFactory:
             "ANSIBLE_ACTION_WARNINGS": str(int(verbosity > 0)),
             "ANSIBLE_DEVEL_WARNING": str(int(verbosity > 0)),
         }
+        ssh_args = "-o ForwardX11=no -o StrictHostKeyChecking=no"
+        transport_config: dict[str, str] = {}
+        ssh_connection: dict[str, str] = {}
+        probe_versions = (
+            skip_version_check is False
+            and not self.local_debug
+            and bool(set(self.step_order) - set(self.steps))
+        )
+        if fast_transport or probe_versions:
+            # The version probe and the deployment share one ssh connection
+            # per host.
+            ssh_args += f" {SSH_MULTIPLEX_ARGS}"
+            ssh_connection = self._td.fast_transport_config(
+                pipelining=fast_transport
+            )
+        if fast_transport:
+            transport_config["forks"] = str(min(max(len(self.hosts), 5), 50))
+        if fact_cache:
+            transport_config.update(self._fact_cache_config())
         self._td.create_config(
+            ssh_connection=ssh_connection,
+            **transport_config,
             cowsay_enabled_stencils="default,sheep,moose",
             stdout_callback="deployment_plugin",
             callback_plugins=str(plugin_path),
@@ -1137,10 +1469,34 @@ class DeployFactory:
         extravars: dict[str, str] = {
             "ansible_port": str(ssh_port),
             "ansible_config": str(self._td.ansible_config_file),
-            "ansible_ssh_args": "-o ForwardX11=no -o StrictHostKeyChecking=no",
+            "ansible_ssh_args": ssh_args,
         }
+        if os.getenv("FREVA_DEPLOYMENT_MICROMAMBA_DIR"):
+            extravars["micromamba_dir"] = os.environ[
+                "FREVA_DEPLOYMENT_MICROMAMBA_DIR"
+            ]
+        # Container images pulled in the background during this deployment
+        # are not pulled again.
+        extravars["deployment_run_id"] = f"{self._play_started}-{os.getpid()}"
+        conda_locks = os.getenv("FREVA_DEPLOYMENT_CONDA_LOCKS") or str(
+            Path(appdirs.user_data_dir("freva-deployment")) / "conda-locks"
+        )
+        if conda_locks.lower() != "none":
+            extravars["conda_lock_dir"] = conda_locks
+        if fact_cache:
+            extravars["fact_gather_subset"] = os.getenv(
+                "FREVA_DEPLOYMENT_FACT_GATHER_SUBSET", "!all,min"
+            )
 
         self.passwords = self.get_ansible_password(ask_pass)
+        if not skip_preflight and not self.local_debug:
+            # The ssh connections of the check are reused by the playbooks
+            # if they are multiplexed.
+            self._preflight(
+                ssh_port,
+                tags,
+                self._td.control_path_dir if ssh_connection else None,
+            )
         steps = [s for s in self.steps]
 
         self._set_deployment_methods()
@@ -1165,20 +1521,52 @@ class DeployFactory:
             extravars["ansible_connection"] = "local"
         logger.debug(inventory)
         self.create_eval_config()
+        playbook = asset_dir / "playbooks" / "main-deployment.yml"
+        extravars["deployment_digests"] = json.dumps(
+            play_digests(
+                playbook,
+                yaml.safe_load(inventory),
+                asset_dir,
+                ignore=GENERATED_VARS,
+                linked=LINKED_PLAYS,
+            )
+        )
+        extravars["deployment_force"] = str(force).lower()
         RichConsole.rule(
             f"[r]Playing tasks: [i]{', '.join(tags or steps)}[/] with ansible[/]"
         )
         time.sleep(3)
-        self._td.run_ansible_playbook(
-            working_dir=asset_dir,
-            playbook=asset_dir / "playbooks" / "main-deployment.yml",
-            inventory=inventory,
-            envvars=envvars,
-            tags=tags or steps,
-            passwords=self.passwords,
-            extravars=extravars,
-            verbosity=verbosity,
-        )
+        if jobs > 1:
+            log = PlayScheduler(
+                playbook,
+                inventory,
+                tags=tags or steps,
+                max_jobs=jobs,
+            ).run(
+                self._td,
+                working_dir=asset_dir,
+                envvars=envvars,
+                tags=tags or steps,
+                passwords=self.passwords,
+                extravars=extravars,
+                verbosity=verbosity,
+            )
+        else:
+            log = self._td.run_ansible_playbook(
+                working_dir=asset_dir,
+                playbook=playbook,
+                inventory=inventory,
+                envvars=envvars,
+                tags=tags or steps,
+                passwords=self.passwords,
+                extravars=extravars,
+                verbosity=verbosity,
+            )
+        if fast_transport and not self.local_debug:
+            logger.info(
+                "Fast transport saved ~%i ssh handshakes",
+                ssh_handshakes_saved(log),
+            )
         if self.local_debug:
             RichConsole.rule("[b red]:bulb:   NOTE:[/]")
             RichConsole.print(
@@ -0,0 +1,122 @@
+"""Digests of the deployment plays for incremental deployments."""
+
+from __future__ import annotations
+
+import hashlib
+import json
+from pathlib import Path
+from typing import Any, Dict, Iterable, List
+
+import yaml
+
+SHARED_PATHS = (
+    "playbooks/tasks",
+    "playbooks/templates",
+    "playbooks/vars.yml",
+    "scripts",
+    "vault",
+    "web_service",
+)
+"""Paths, relative to the asset dir, that are used by all roles."""
+
+
+def _files(path: Path) -> List[Path]:
+    if path.is_dir():
+        return sorted(p for p in path.rglob("*") if p.is_file())
+    if path.is_file():
+        return [path]
+    return []
+
+
+def _update(digest: Any, path: Path) -> None:
+    """Add the names and content of a file or directory to a digest."""
+    for file in _files(path):
+        digest.update(file.relative_to(path.parent).as_posix().encode())
+        digest.update(file.read_bytes())
+
+
+def _normalise(value: Any) -> Any:
+    """Replace paths to local files by the digest of their content.
+
+    Files like the evaluation_system.conf are written to a new temporary
+    directory for every deployment, only their content matters.
+    """
+    if isinstance(value, str) and value.startswith("/"):
+        try:
+            if Path(value).is_file():
+                return hashlib.sha256(Path(value).read_bytes()).hexdigest()
+        except OSError:
+            pass
+    return value
+
+
+def play_digests(
+    playbook: Path,
+    inventory: Dict[str, Any],
+    asset_dir: Path,
+    ignore: Iterable[str] = (),
+    linked: Iterable[Iterable[str]] = (),
+) -> Dict[str, str]:
+    """Compute a digest of the input of every play that deploys roles.
+
+    The digest covers the inventory variables of the host group of a play,
+    the content of the local files these variables point to, the roles of
+    the play and the tasks, templates and scripts shared by all roles.
+
+    Parameters
+    ----------
+    playbook: Path
+        The deployment playbook.
+    inventory: dict
+        The inventory of the deployment.
+    asset_dir: Path
+        The directory holding the playbooks and scripts.
+    ignore: list[str], default: ()
+        Variables that are left out, for example because they are generated
+        anew for every deployment.
+    linked: list[list[str]], default: ()
+        Names of plays that share generated credentials. The plays of a
+        group get a common digest, so that they are either all skipped or
+        all deployed again. Plays without roles in such a group get the
+        common digest as well.
+
+    Returns
+    -------
+    dict[str, str]: The digest of each play, by play name.
+    """
+    skip = set(ignore)
+    digests: Dict[str, str] = {}
+    deployed = []
+    for play in yaml.safe_load(Path(playbook).read_text()):
+        group = play.get("hosts")
+        roles = [
+            r if isinstance(r, str) else r.get("role", "")
+            for r in play.get("roles") or []
+        ]
+        if group not in inventory:
+            continue
+        deployed.append(play["name"].strip())
+        if not roles:
+            continue
+        variables = {
+            key: _normalise(value)
+            for key, value in (inventory[group] or {}).get("vars", {}).items()
+            if key not in skip
+        }
+        digest = hashlib.sha256(
+            json.dumps(variables, sort_keys=True, default=str).encode()
+        )
+        for role in roles:
+            _update(digest, Path(playbook).parent / "roles" / role)
+        for path in SHARED_PATHS:
+            _update(digest, Path(asset_dir) / path)
+        digests[play["name"].strip()] = digest.hexdigest()
+    for names in linked:
+        members = [name for name in names if name in deployed]
+        if not any(name in digests for name in members):
+            continue
+        digest = hashlib.sha256()
+        for name in members:
+            digest.update(f"{name}={digests.get(name, '')}".encode())
+        digests.update(dict.fromkeys(members, digest.hexdigest()))
+    return digests
@@ -0,0 +1,262 @@
+"""Deploy the services of many projects concurrently."""
+
+from __future__ import annotations
+
+import os
+import subprocess
+import sys
+import time
+from collections import Counter
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, FrozenSet, List, NamedTuple, Optional, Sequence
+
+from appdirs import user_log_dir
+from rich.console import Console, Group
+from rich.live import Live
+from rich.spinner import Spinner
+from rich.table import Table
+
+from .deploy import (
+    EXTERNAL_HOST_KEYS,
+    DeployFactory,
+    get_eval_config_template,
+)
+from .error import ConfigurationError, DeploymentError
+from .logger import logger
+from .playbook_index import PlaybookIndex
+from .utils import asset_dir, load_config
+from .versions import VersionManifest
+
+
+class FleetMember(NamedTuple):
+    """The deployment of a single project."""
+
+    config_file: Path
+    project_name: str
+    hosts: FrozenSet[str]
+
+
+class FleetResult(NamedTuple):
+    """Outcome of the deployment of a single project."""
+
+    member: FleetMember
+    returncode: Optional[int]
+    duration: float
+    log_file: Path
+
+
+class Fleet:
+    """Deploy many project inventories with a bounded pool of workers.
+
+    Every project is deployed by its own ``deploy-freva cmd`` process. The
+    version manifest, the playbook index and the auxiliary files are
+    fetched once before any deployment starts and shared by all of them. A
+    project is only started once every host it uses runs fewer than
+    ``max_per_host`` deployments.
+
+    Parameters
+    ----------
+    config_files: Sequence[Path]
+        The inventory files of the projects.
+    max_jobs: int, default: 2
+        Maximum number of projects that are deployed at a time.
+    max_per_host: int, default: 1
+        Maximum number of projects that are deployed on one host at a time.
+    log_dir: Path, default: None
+        Directory for the output of the deployments, defaults to a new
+        directory in the user log dir.
+    """
+
+    def __init__(
+        self,
+        config_files: Sequence[Path],
+        max_jobs: int = 2,
+        max_per_host: int = 1,
+        log_dir: Optional[Path] = None,
+    ) -> None:
+        self.max_jobs = max(max_jobs, 1)
+        self.max_per_host = max(max_per_host, 1)
+        self.log_dir = log_dir or (
+            Path(user_log_dir("freva-deployment"))
+            / "fleet"
+            / datetime.now().strftime("%Y%m%dT%H%M%S")
+        )
+        self.members: List[FleetMember] = []
+        for config_file in config_files:
+            member = self._read_member(Path(config_file))
+            if member.project_name in [m.project_name for m in self.members]:
+                raise ConfigurationError(
+                    f"Project {member.project_name} is defined twice."
+                )
+            self.members.append(member)
+
+    @staticmethod
+    def _read_member(config_file: Path) -> FleetMember:
+        """Read the project name and the hosts of an inventory."""
+        config_file = config_file.expanduser().absolute()
+        cfg = load_config(config_file, convert=True, read_only=True)
+        project_name = cfg.get("project_name")
+        if not project_name:
+            raise ConfigurationError(
+                f"You must set a project name in {config_file}"
+            )
+        hosts = {
+            host
+            for section in cfg.values()
+            for host in DeployFactory._section_hosts(
+                section, EXTERNAL_HOST_KEYS
+            )
+        }
+        return FleetMember(config_file, project_name, frozenset(hosts))
+
+    @staticmethod
+    def prepare_shared_cache() -> None:
+        """Fetch the files all deployments need, once."""
+        VersionManifest().refresh_if_stale()
+        PlaybookIndex(asset_dir / "playbooks").variables
+        get_eval_config_template()
+
+    def _ready(
+        self, started: set[str], busy_hosts: Counter[str]
+    ) -> List[FleetMember]:
+        """Projects that can be started without exceeding the host limit."""
+        ready = []
+        busy = busy_hosts.copy()
+        for member in self.members:
+            if member.project_name in started:
+                continue
+            if all(busy[h] < self.max_per_host for h in member.hosts):
+                ready.append(member)
+                busy.update(member.hosts)
+        return ready
+
+    def run(
+        self,
+        args: Sequence[str] = (),
+        envvars: Optional[Dict[str, str]] = None,
+        master_passwords: Optional[Dict[str, str]] = None,
+    ) -> List[FleetResult]:
+        """Deploy all projects.
+
+        Parameters
+        ----------
+        args: Sequence[str], default: ()
+            Command line arguments that are passed to ``deploy-freva cmd``.
+        envvars: dict[str, str], default: None
+            Environment variables that are set for all deployments.
+        master_passwords: dict[str, str], default: None
+            The master passwords of the projects.
+
+        Returns
+        -------
+        list[FleetResult]: The results in the order of the projects.
+
+        Raises
+        ------
+        DeploymentError: If the deployment of any project failed.
+        """
+        self.prepare_shared_cache()
+        self.log_dir.mkdir(exist_ok=True, parents=True)
+        master_passwords = master_passwords or {}
+        env = {
+            **os.environ,
+            **(envvars or {}),
+            "FREVA_DEPLOYMENT_OFFLINE": "1",
+        }
+        busy_hosts: Counter[str] = Counter()
+        running: Dict[str, subprocess.Popen[bytes]] = {}
+        spinners: Dict[str, Spinner] = {}
+        starts: Dict[str, float] = {}
+        results: Dict[str, FleetResult] = {}
+        members = {m.project_name: m for m in self.members}
+        with Live(
+            Group(), refresh_per_second=3, console=Console(stderr=True)
+        ) as live:
+            try:
+                while len(results) < len(self.members):
+                    for member in self._ready(set(starts), busy_hosts):
+                        if len(running) >= self.max_jobs:
+                            break
+                        name = member.project_name
+                        log_file = self.log_dir / f"{name}.log"
+                        command = [
+                            sys.executable,
+                            "-m",
+                            "freva_deployment",
+                            "cmd",
+                            "--config",
+                            str(member.config_file),
+                            *args,
+                        ]
+                        logger.debug("Deploying %s: %s", name, command)
+                        with log_file.open("wb") as stream:
+                            running[name] = subprocess.Popen(
+                                command,
+                                stdin=subprocess.DEVNULL,
+                                stdout=stream,
+                                stderr=subprocess.STDOUT,
+                                env={
+                                    **env,
+                                    "MASTER_PASSWD": master_passwords.get(
+                                        name, env.get("MASTER_PASSWD", "")
+                                    ),
+                                },
+                            )
+                        starts[name] = time.monotonic()
+                        busy_hosts.update(member.hosts)
+                        spinners[name] = Spinner("weather", text=name)
+                        live.update(Group(*spinners.values()))
+                    time.sleep(0.2)
+                    for name, proc in list(running.items()):
+                        if proc.poll() is None:
+                            continue
+                        running.pop(name)
+                        busy_hosts.subtract(members[name].hosts)
+                        results[name] = FleetResult(
+                            members[name],
+                            proc.returncode,
+                            time.monotonic() - starts[name],
+                            self.log_dir / f"{name}.log",
+                        )
+                        status = (
+                            "[green]ok[/]"
+                            if proc.returncode == 0
+                            else "[red]failed[/]"
+                        )
+                        spinners[name].update(text=f"{name} {status}")
+            except KeyboardInterrupt:
+                for name, proc in running.items():
+                    proc.terminate()
+                    spinners[name].update(text=f"{name} [yellow]canceled[/]")
+                for proc in running.values():
+                    proc.wait()
+                raise KeyboardInterrupt("User interrupted execution") from None
+        ordered = [results[m.project_name] for m in self.members]
+        Console().print(self.table(ordered))
+        failed = [r.member.project_name for r in ordered if r.returncode]
+        if failed:
+            raise DeploymentError(
+                f"Deployment failed for: {', '.join(failed)}, "
+                f"see the logs in {self.log_dir}"
+            )
+        return ordered
+
+    @staticmethod
+    def table(results: Sequence[FleetResult]) -> Table:
+        """Summarise the deployments in a table."""
+        table = Table(title="Fleet deployment", title_justify="left")
+        table.add_column("Project", no_wrap=True)
+        table.add_column("Hosts")
+        table.add_column("Status")
+        table.add_column("Time", justify="right")
+        table.add_column("Log", overflow="fold")
+        for result in results:
+            table.add_row(
+                result.member.project_name,
+                ", ".join(sorted(result.member.hosts)),
+                "[green]ok[/]" if result.returncode == 0 else "[red]failed[/]",
+                f"{result.duration:.0f}s",
+                str(result.log_file),
+            )
+        return table
@@ -1,9 +1,15 @@
 """Generate keys."""
 
 import datetime
+import hashlib
+import os
 from pathlib import Path
 from tempfile import TemporaryDirectory
-from typing import Optional
+from typing import Any, Dict, Optional, Tuple
+
+from appdirs import user_data_dir
+
+from .logger import logger
 
 _CRYPTO = True
 try:
@@ -20,6 +26,140 @@ try:
 except ImportError:
     _CRYPTO = False
 
+ALGORITHMS = ("rsa", "ecdsa", "ed25519")
+"""The supported key algorithms."""
+
+
+def _check_crypto() -> None:
+    if not _CRYPTO:
+        raise ImportError(
+            "Please install the `cryptography` python module."
+            " in order to generate certificates."
+        )
+
+
+class KeyStore:
+    """Keep generated keys and certificates on disk for reuse.
+
+    Keys are stored by common name, key algorithm and issuing certificate
+    authority. A stored certificate is only reused while it is valid for at
+    least ``min_valid`` more days.
+
+    Parameters
+    ----------
+    path: Path, default: None
+        Directory holding the keys, defaults to the
+        ``FREVA_DEPLOYMENT_KEY_STORE`` env variable or the user data dir.
+    min_valid: int, default: 30
+        Days a stored certificate must still be valid to be reused.
+    """
+
+    _loaded: Dict[Path, Tuple[Any, Any]] = {}
+    """Keys and certificates that have already been read, by key file."""
+
+    def __init__(self, path: Optional[Path] = None, min_valid: int = 30):
+        self.path = Path(
+            path
+            or os.getenv("FREVA_DEPLOYMENT_KEY_STORE")
+            or Path(user_data_dir("freva-deployment")) / "keys"
+        )
+        self.min_valid = datetime.timedelta(days=min_valid)
+
+    @classmethod
+    def from_env(cls) -> Optional["KeyStore"]:
+        """Get the default store, None if the store is disabled.
+
+        The store is disabled by setting ``FREVA_DEPLOYMENT_KEY_STORE``
+        to ``none``.
+        """
+        if os.getenv("FREVA_DEPLOYMENT_KEY_STORE", "").lower() == "none":
+            return None
+        return cls()
+
+    def _files(
+        self, common_name: str, algorithm: str, issuer: str
+    ) -> Tuple[Path, Path]:
+        key = f"{common_name}:{algorithm}".encode()
+        if issuer:
+            key += f":{issuer}".encode()
+        name = hashlib.sha256(key).hexdigest()
+        return self.path / f"{name}.key", self.path / f"{name}.crt"
+
+    def load(
+        self, common_name: str, algorithm: str, issuer: str = ""
+    ) -> Optional[Tuple[Any, Any]]:
+        """Get a stored key and certificate if they can be reused.
+
+        Parameters
+        ----------
+        common_name: str
+            The common name of the certificate.
+        algorithm: str
+            The key algorithm.
+        issuer: str, default: ""
+            Fingerprint of the issuing certificate authority, empty for
+            self-signed certificates.
+
+        Returns
+        -------
+        tuple: The private key and the certificate, None if there is no
+               valid certificate.
+        """
+        _check_crypto()
+        key_file, cert_file = self._files(common_name, algorithm, issuer)
+        entry = self._loaded.get(key_file)
+        if entry is None:
+            try:
+                # The store only holds keys we've generated ourselves,
+                # checking rsa keys again is expensive.
+                entry = (
+                    serialization.load_pem_private_key(
+                        key_file.read_bytes(),
+                        password=None,
+                        unsafe_skip_rsa_key_validation=True,
+                    ),
+                    x509.load_pem_x509_certificate(cert_file.read_bytes()),
+                )
+            except (OSError, ValueError):
+                return None
+        expires = datetime.datetime.now(datetime.timezone.utc) + self.min_valid
+        if entry[1].not_valid_after_utc < expires:
+            self._loaded.pop(key_file, None)
+            return None
+        self._loaded[key_file] = entry
+        return entry
+
+    def save(
+        self,
+        common_name: str,
+        algorithm: str,
+        private_key: Any,
+        certificate: Any,
+        issuer: str = "",
+    ) -> None:
+        """Store a key and its certificate, only readable by the user."""
+        key_file, cert_file = self._files(common_name, algorithm, issuer)
+        key_pem = private_key.private_bytes(
+            encoding=serialization.Encoding.PEM,
+            format=serialization.PrivateFormat.PKCS8,
+            encryption_algorithm=serialization.NoEncryption(),
+        )
+        cert_pem = certificate.public_bytes(serialization.Encoding.PEM)
+        try:
+            self.path.mkdir(mode=0o700, exist_ok=True, parents=True)
+            for path, content in ((key_file, key_pem), (cert_file, cert_pem)):
+                temp_file = path.with_suffix(f".{os.getpid()}.tmp")
+                fd = os.open(
+                    temp_file, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600
+                )
+                with os.fdopen(fd, "wb") as stream:
+                    stream.write(content)
+                os.replace(temp_file, path)
+        except OSError as error:
+            logger.debug("Could not store key for %s: %s", common_name, error)
+            return
+        self._loaded[key_file] = (private_key, certificate)
+
 
 class RandomKeys:
     """Generate public and private server keys.
@@ -27,25 +167,44 @@ class RandomKeys:
     Parameters:
         base_name (str): The path prefix for all key files.
         common_name (str): The common name for the certificate.
+        algorithm (str): The key algorithm, one of rsa, ecdsa (P-256) or
+            ed25519. Defaults to the ``FREVA_DEPLOYMENT_KEY_ALGORITHM`` env
+            variable or rsa.
+        store (KeyStore): Reuse keys and certificates from this store,
+            new keys are added to it. By default keys are not stored.
+        ca (LocalCA): Certificate authority that issues the certificate,
+            by default the certificate is self-signed.
+        days (int): Days the certificate is valid.
     """
 
     def __init__(
-        self, base_name: str = "freva", common_name: str = "localhost"
+        self,
+        base_name: str = "freva",
+        common_name: str = "localhost",
+        algorithm: Optional[str] = None,
+        store: Optional[KeyStore] = None,
+        ca: Optional["LocalCA"] = None,
+        days: int = 10 * 365,
     ) -> None:
         self.base_name = base_name
         self.common_name = common_name
+        self.algorithm = (
+            algorithm or os.getenv("FREVA_DEPLOYMENT_KEY_ALGORITHM") or "rsa"
+        ).lower()
+        if self.algorithm not in ALGORITHMS:
+            raise ValueError(
+                f"Key algorithm must be one of {', '.join(ALGORITHMS)}"
+            )
+        self.store = store
+        self.ca = ca
+        self.days = days
         self._private_key_pem: Optional[bytes] = None
         self._public_key_pem: Optional[bytes] = None
-        self._private_key: Optional["rsa.RSAPrivateKey"] = None
+        self._private_key: Any = None
+        self._certificate: Any = None
         self._temp_dir = TemporaryDirectory("random_keys")
 
-    @staticmethod
-    def _check_crypto() -> None:
-        if not _CRYPTO:
-            raise ImportError(
-                "Please install the `cryptography` python module."
-                " in order to generate certificates."
-            )
+    _check_crypto = staticmethod(_check_crypto)
 
     def check_cert_key_pair(self, cert_path: str, key_path: str) -> bool:
         """Validate a certificate/key pair by checking:
@@ -86,6 +245,8 @@ class RandomKeys:
             return False
         if cert.issuer == cert.subject:
             return False
+        if self.ca is not None and cert.issuer == self.ca.certificate.subject:
+            return False
 
         message = b"test"
         try:
@@ -121,12 +282,38 @@ class RandomKeys:
             return False
 
     @property
-    def private_key(self) -> "rsa.RSAPrivateKey":
-        if self._private_key is not None:
+    def _issuer(self) -> str:
+        """Fingerprint of the issuing certificate authority."""
+        if self.ca is None:
+            return ""
+        return self.ca.certificate.fingerprint(hashes.SHA256()).hex()
+
+    def _load(self) -> bool:
+        """Take the key and certificate from the store, if possible."""
+        entry = None
+        if self.store is not None:
+            entry = self.store.load(
+                self.common_name, self.algorithm, self._issuer
+            )
+        if entry is None:
+            return False
+        self._private_key, self._certificate = entry
+        return True
+
+    @property
+    def private_key(self) -> Any:
+        """The private key, either from the store or newly generated."""
+        self._check_crypto()
+        if self._private_key is not None or self._load():
             return self._private_key
-        self._private_key = rsa.generate_private_key(
-            public_exponent=65537, key_size=2048, backend=default_backend()
-        )
+        if self.algorithm == "ecdsa":
+            self._private_key = ec.generate_private_key(ec.SECP256R1())
+        elif self.algorithm == "ed25519":
+            self._private_key = ed25519.Ed25519PrivateKey.generate()
+        else:
+            self._private_key = rsa.generate_private_key(
+                public_exponent=65537, key_size=2048, backend=default_backend()
+            )
         return self._private_key
 
     @property
@@ -144,7 +331,7 @@ class RandomKeys:
     @property
     def public_key_pem(self) -> bytes:
         """
-        Generate a public key pair using RSA algorithm.
+        Get the public key of the private key.
 
         Returns:
             bytes: The public key (PEM format).
@@ -204,54 +391,177 @@ class RandomKeys:
             temp_file.write_bytes(self.certificate_chain)
         return str(temp_file)
 
-    def create_self_signed_cert(self) -> "x509.Certificate":
+    @property
+    def _hash(self) -> Any:
+        """The signature hash, ed25519 keys don't take one."""
+        return None if self.algorithm == "ed25519" else hashes.SHA256()
+
+    def _add_extensions(self, builder: Any) -> Any:
+        """Add the extensions of a server certificate."""
+        builder = builder.add_extension(
+            x509.SubjectAlternativeName(
+                [
+                    x509.DNSName(f"{self.common_name}"),
+                    x509.DNSName(f"www.{self.common_name}"),
+                ]
+            ),
+            critical=False,
+        )
+        if self.ca is None:
+            return builder
+        return builder.add_extension(
+            x509.BasicConstraints(ca=False, path_length=None), critical=True
+        ).add_extension(
+            x509.ExtendedKeyUsage(
+                [
+                    x509.oid.ExtendedKeyUsageOID.SERVER_AUTH,
+                    x509.oid.ExtendedKeyUsageOID.CLIENT_AUTH,
+                ]
+            ),
+            critical=False,
+        )
+
+    @property
+    def certificate(self) -> "x509.Certificate":
         """
-        Create a self-signed certificate using the public key.
+        The certificate of the public key.
+
+        The certificate is signed by the certificate authority, if given,
+        or else self-signed. It is only created once and added to the key
+        store.
 
         Returns
         -------
-            x509.Certificate: The self-signed certificate.
+            x509.Certificate: The certificate.
         """
         self._check_crypto()
-        csr = (
-            x509.CertificateSigningRequestBuilder()
-            .subject_name(
-                x509.Name(
-                    [x509.NameAttribute(NameOID.COMMON_NAME, self.common_name)]
-                )
-            )
-            .sign(self.private_key, hashes.SHA256(), default_backend())
-        )
-        # Add SANs
-        san = x509.SubjectAlternativeName(
-            [
-                x509.DNSName(f"{self.common_name}"),
-                x509.DNSName(f"www.{self.common_name}"),
-            ]
+        private_key = self.private_key  # Loads a stored certificate.
+        if self._certificate is not None:
+            return self._certificate
+        subject = x509.Name(
+            [x509.NameAttribute(NameOID.COMMON_NAME, self.common_name)]
         )
-        certificate = (
+        signer = self.ca or self
+        now = datetime.datetime.now(datetime.timezone.utc)
+        builder = (
             x509.CertificateBuilder()
-            .subject_name(csr.subject)
-            .issuer_name(csr.subject)
-            .add_extension(san, critical=False)
-            .public_key(csr.public_key())
+            .subject_name(subject)
+            .issuer_name(self.ca.certificate.subject if self.ca else subject)
+            .public_key(private_key.public_key())
             .serial_number(x509.random_serial_number())
-            .not_valid_before(datetime.datetime.now(datetime.timezone.utc))
-            .not_valid_after(
-                datetime.datetime.now(datetime.timezone.utc)
-                + datetime.timedelta(days=10 * 365)
-            )
-            .sign(self.private_key, hashes.SHA256(), default_backend())
+            .not_valid_before(now)
+            .not_valid_after(now + datetime.timedelta(days=self.days))
         )
-
+        certificate = self._add_extensions(builder).sign(
+            signer.private_key, signer._hash, default_backend()
+        )
+        self._certificate = certificate
+        if self.store is not None:
+            self.store.save(
+                self.common_name,
+                self.algorithm,
+                private_key,
+                certificate,
+                self._issuer,
+            )
         return certificate
 
     @property
     def certificate_chain(self) -> bytes:
         """The certificate chain."""
-        certificate = self.create_self_signed_cert()
-        certificate_pem = certificate.public_bytes(serialization.Encoding.PEM)
-        return self.public_key_pem + certificate_pem
+        chain = self.public_key_pem + self.certificate.public_bytes(
+            serialization.Encoding.PEM
+        )
+        if self.ca is not None:
+            chain += self.ca.certificate_pem
+        return chain
+
+
+class LocalCA(RandomKeys):
+    """Certificate authority of a deployment.
+
+    The authority is kept in the key store and issues short lived
+    certificates for the services of a deployment. Clients only need to
+    trust the certificate of the authority, which doesn't change when the
+    service certificates are issued again.
+
+    Parameters:
+        name (str): The name of the deployment.
+        store (KeyStore): The store keeping the authority and the issued
+            certificates, defaults to the default key store.
+        algorithm (str): The key algorithm of the authority.
+        leaf_days (int): Days the issued certificates are valid.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        store: Optional[KeyStore] = None,
+        algorithm: Optional[str] = None,
+        leaf_days: int = 90,
+    ) -> None:
+        super().__init__(
+            f"{name}-ca",
+            f"{name} deployment CA",
+            algorithm=algorithm,
+            store=store if store is not None else KeyStore.from_env(),
+        )
+        self.leaf_days = leaf_days
+        self._issued: Dict[Tuple[str, str], RandomKeys] = {}
+
+    def _add_extensions(self, builder: Any) -> Any:
+        """Add the extensions of a certificate authority."""
+        return builder.add_extension(
+            x509.BasicConstraints(ca=True, path_length=0), critical=True
+        ).add_extension(
+            x509.KeyUsage(
+                digital_signature=False,
+                content_commitment=False,
+                key_encipherment=False,
+                data_encipherment=False,
+                key_agreement=False,
+                key_cert_sign=True,
+                crl_sign=True,
+                encipher_only=False,
+                decipher_only=False,
+            ),
+            critical=True,
+        )
+
+    @property
+    def certificate_pem(self) -> bytes:
+        """The certificate of the authority."""
+        return self.certificate.public_bytes(serialization.Encoding.PEM)
+
+    @property
+    def certificate_file(self) -> str:
+        """
+        Save the certificate of the authority to a file.
+
+        Returns:
+            str: The filename of the certificate file.
+        """
+        temp_file = (Path(self._temp_dir.name) / self.base_name).with_suffix(
+            ".crt"
+        )
+        if not temp_file.is_file():
+            temp_file.write_bytes(self.certificate_pem)
+        return str(temp_file)
+
+    def issue(
+        self, common_name: str, base_name: str = "freva"
+    ) -> RandomKeys:
+        """Get the keys of a service, signed by this authority."""
+        if (common_name, base_name) not in self._issued:
+            self._issued[(common_name, base_name)] = RandomKeys(
+                base_name,
+                common_name,
+                algorithm=self.algorithm,
+                store=self.store,
+                ca=self,
+                days=self.leaf_days,
+            )
+        return self._issued[(common_name, base_name)]
 
 
 if __name__ == "__main__":
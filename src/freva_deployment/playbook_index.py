@@ -0,0 +1,144 @@
+"""Index of the variables that are referenced by the playbooks."""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import re
+from difflib import get_close_matches
+from pathlib import Path
+from typing import Dict, FrozenSet, Iterable, List, Mapping, Optional
+
+from appdirs import user_cache_dir
+
+from .logger import logger
+
+_JINJA_BLOCK = re.compile(r"{{(.*?)}}|{%(.*?)%}", re.DOTALL)
+_JINJA_COMMENT = re.compile(r"{#.*?#}", re.DOTALL)
+_YAML_COMMENT = re.compile(r"(^|\s)#.*$", re.MULTILINE)
+_IDENTIFIER = re.compile(r"[A-Za-z_][A-Za-z0-9_]*")
+
+
+class PlaybookIndex:
+    """Set of variable names the playbooks, roles and templates reference.
+
+    YAML files are evaluated as a whole, because ansible accepts bare jinja
+    expressions in keys like ``when`` or ``loop``, while all other files
+    only contribute the names used inside their jinja blocks. Comments are
+    ignored. The index is cached in the user cache dir and rebuilt once any
+    of the playbook files changes.
+
+    Parameters
+    ----------
+    playbook_dir: Path
+        Directory holding the playbooks.
+    cache_file: Path, default: None
+        Path to the file holding the cached index, defaults to the user
+        cache dir.
+    """
+
+    yaml_suffixes = (".yml", ".yaml")
+
+    def __init__(
+        self, playbook_dir: Path, cache_file: Optional[Path] = None
+    ) -> None:
+        self.playbook_dir = Path(playbook_dir)
+        self.cache_file = cache_file or (
+            Path(user_cache_dir("freva-deployment")) / "playbook_index.json"
+        )
+        self._variables: Optional[FrozenSet[str]] = None
+
+    @property
+    def files(self) -> List[Path]:
+        """All files of the playbook directory."""
+        return sorted(f for f in self.playbook_dir.rglob("*") if f.is_file())
+
+    @property
+    def signature(self) -> str:
+        """A digest of the paths, sizes and mtimes of all playbook files."""
+        digest = hashlib.sha256(str(self.playbook_dir).encode())
+        for path in self.files:
+            stat = path.stat()
+            digest.update(f"{path}:{stat.st_size}:{stat.st_mtime_ns}".encode())
+        return digest.hexdigest()
+
+    @classmethod
+    def scan(cls, path: Path) -> Iterable[str]:
+        """Get the variable names that are referenced in a file."""
+        content = _JINJA_COMMENT.sub("", path.read_text(errors="ignore"))
+        if path.suffix in cls.yaml_suffixes:
+            yield from _IDENTIFIER.findall(_YAML_COMMENT.sub("", content))
+            return
+        for block in _JINJA_BLOCK.findall(content):
+            yield from _IDENTIFIER.findall("".join(block))
+
+    def build(self) -> FrozenSet[str]:
+        """Create the index from the content of the playbooks."""
+        variables: set[str] = set()
+        for path in self.files:
+            variables.update(self.scan(path))
+        return frozenset(variables)
+
+    @property
+    def variables(self) -> FrozenSet[str]:
+        """The variable names referenced by the playbooks."""
+        if self._variables is not None:
+            return self._variables
+        signature = self.signature
+        try:
+            cache = json.loads(self.cache_file.read_text())
+        except (FileNotFoundError, json.JSONDecodeError):
+            cache = {}
+        if cache.get("signature") == signature:
+            self._variables = frozenset(cache.get("variables", []))
+            return self._variables
+        self._variables = self.build()
+        try:
+            self.cache_file.parent.mkdir(exist_ok=True, parents=True)
+            temp_file = self.cache_file.with_suffix(f".{os.getpid()}.tmp")
+            temp_file.write_text(
+                json.dumps(
+                    {
+                        "signature": signature,
+                        "variables": sorted(self._variables),
+                    }
+                )
+            )
+            os.replace(temp_file, self.cache_file)
+        except OSError as error:
+            logger.debug("Could not write playbook index: %s", error)
+        return self._variables
+
+    def __contains__(self, key: object) -> bool:
+        return key in self.variables
+
+    def check_keys(
+        self,
+        config: Mapping[str, Iterable[str]],
+        known_keys: Mapping[str, Iterable[str]],
+    ) -> None:
+        """Warn about config keys that are neither known nor used.
+
+        Parameters
+        ----------
+        config: dict
+            The keys of each section of the user config.
+        known_keys: dict
+            The keys of each section that are known to the deployment.
+        """
+        for section, keys in config.items():
+            if section not in known_keys:
+                continue
+            known = list(known_keys[section])
+            for key in keys:
+                if key in known or key in self or f"{section}_{key}" in self:
+                    continue
+                suggestion = get_close_matches(key, known, n=1)
+                hint = f", did you mean {suggestion[0]}?" if suggestion else ""
+                logger.warning(
+                    "Config key %s in section %s is not used%s",
+                    key,
+                    section,
+                    hint,
+                )
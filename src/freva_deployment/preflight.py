@@ -0,0 +1,233 @@
+"""Check that all hosts can be reached before the deployment starts."""
+
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import os
+import shlex
+import shutil
+import time
+from pathlib import Path
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from rich.console import Console
+from rich.table import Table
+
+from .logger import logger
+from .runner import SSH_MULTIPLEX_ARGS
+
+SSH_ARGS = ("-o", "ForwardX11=no", "-o", "StrictHostKeyChecking=no")
+
+
+class ProbeTarget(NamedTuple):
+    """A host and the users the deployment connects with."""
+
+    host: str
+    user: str
+    become_user: str
+    services: Tuple[str, ...]
+
+
+class ProbeResult(NamedTuple):
+    """Outcome of probing a single target."""
+
+    target: ProbeTarget
+    ssh: Optional[bool] = None
+    sudo: Optional[bool] = None
+    message: str = ""
+    duration: float = 0.0
+
+    @property
+    def ok(self) -> bool:
+        """True if the deployment can connect and elevate privileges."""
+        return bool(self.ssh) and self.sudo is not False
+
+
+class Preflight:
+    """Probe the ssh login and sudo of many hosts concurrently.
+
+    Parameters
+    ----------
+    targets: Iterable[ProbeTarget]
+        The hosts and users that should be probed.
+    port: int, default: 22
+        The ssh port of the hosts.
+    passwords: dict[str, str], default: None
+        The ``ansible_ssh_pass`` and ``ansible_become_pass`` passwords.
+    timeout: float, default: None
+        Deadline for probing a single host, defaults to the
+        ``FREVA_DEPLOYMENT_PREFLIGHT_TIMEOUT`` env var or 10 seconds.
+    max_jobs: int, default: None
+        Number of hosts probed at the same time, defaults to the
+        ``FREVA_DEPLOYMENT_PREFLIGHT_JOBS`` env var or 32.
+    control_path_dir: Path, default: None
+        Directory of the ssh control sockets of the deployment. If given,
+        the ssh connections of the probe stay open and are reused by the
+        playbooks.
+    """
+
+    def __init__(
+        self,
+        targets: Iterable[ProbeTarget],
+        port: int = 22,
+        passwords: Optional[Dict[str, str]] = None,
+        timeout: Optional[float] = None,
+        max_jobs: Optional[int] = None,
+        control_path_dir: Optional[Path] = None,
+    ) -> None:
+        self.targets = list(targets)
+        self.port = port
+        self.passwords = passwords or {}
+        self.timeout = timeout or float(
+            os.getenv("FREVA_DEPLOYMENT_PREFLIGHT_TIMEOUT", "10")
+        )
+        self.max_jobs = max(
+            max_jobs
+            or int(os.getenv("FREVA_DEPLOYMENT_PREFLIGHT_JOBS", "32")),
+            1,
+        )
+        self.control_path_dir = control_path_dir
+
+    def _ssh_command(self, target: ProbeTarget) -> Tuple[List[str], str]:
+        """Command that logs into the target and checks sudo."""
+        cmd = ["ssh", *SSH_ARGS, "-p", str(self.port)]
+        cmd += ["-o", f"ConnectTimeout={max(int(self.timeout), 1)}"]
+        if self.control_path_dir:
+            # The control socket ansible uses for the host, port and user.
+            key = f"{target.host}-{self.port}-{target.user}".encode()
+            socket = self.control_path_dir / hashlib.sha1(key).hexdigest()[:10]
+            cmd += shlex.split(SSH_MULTIPLEX_ARGS)
+            cmd += ["-o", f"ControlPath={socket}"]
+        if self.passwords.get("ansible_ssh_pass") and shutil.which("sshpass"):
+            cmd = ["sshpass", "-e", *cmd]
+        else:
+            cmd += ["-o", "BatchMode=yes"]
+        remote = "true"
+        stdin = ""
+        if target.become_user:
+            if self.passwords.get("ansible_become_pass"):
+                stdin = self.passwords["ansible_become_pass"] + "\n"
+                remote = "sudo -S -p ''"
+            else:
+                remote = "sudo -n"
+            remote += f" -u {shlex.quote(target.become_user)} true"
+        return cmd + [f"{target.user}@{target.host}", remote], stdin
+
+    async def _probe_login(self, target: ProbeTarget) -> Tuple[int, str]:
+        """Log into the host, return the exit code and the error message."""
+        cmd, stdin = self._ssh_command(target)
+        env = os.environ.copy()
+        env["SSHPASS"] = self.passwords.get("ansible_ssh_pass", "")
+        proc = await asyncio.create_subprocess_exec(
+            *cmd,
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.DEVNULL,
+            stderr=asyncio.subprocess.PIPE,
+            env=env,
+        )
+        try:
+            _, stderr = await proc.communicate(stdin.encode())
+        finally:
+            if proc.returncode is None:
+                proc.kill()
+                await proc.wait()
+        lines = stderr.decode(errors="replace").strip().splitlines()
+        return proc.returncode or 0, (lines[-1] if lines else "")
+
+    async def _probe(self, target: ProbeTarget) -> ProbeResult:
+        """Probe the login and sudo of a single target."""
+        result = ProbeResult(target)
+        try:
+            returncode, message = await self._probe_login(target)
+        except asyncio.CancelledError:
+            raise
+        except Exception as error:
+            return result._replace(ssh=False, message=str(error))
+        if returncode == 255:
+            return result._replace(ssh=False, message=message)
+        if not target.become_user:
+            return result._replace(ssh=True)
+        return result._replace(
+            ssh=True,
+            sudo=returncode == 0,
+            message="" if returncode == 0 else message,
+        )
+
+    async def _run_one(
+        self, target: ProbeTarget, semaphore: asyncio.Semaphore
+    ) -> ProbeResult:
+        async with semaphore:
+            start = time.monotonic()
+            try:
+                result = await asyncio.wait_for(
+                    self._probe(target), self.timeout
+                )
+            except asyncio.TimeoutError:
+                result = ProbeResult(
+                    target, message=f"no answer after {self.timeout:.0f}s"
+                )
+            return result._replace(duration=time.monotonic() - start)
+
+    async def _run(self) -> List[ProbeResult]:
+        semaphore = asyncio.Semaphore(self.max_jobs)
+        return list(
+            await asyncio.gather(
+                *(self._run_one(t, semaphore) for t in self.targets)
+            )
+        )
+
+    def run(self) -> List[ProbeResult]:
+        """Probe all targets, results are in the order of the targets."""
+        if not self.targets:
+            return []
+        start = time.monotonic()
+        results = asyncio.run(self._run())
+        logger.debug(
+            "Probed %i hosts in %.2fs",
+            len(results),
+            time.monotonic() - start,
+        )
+        return results
+
+    @staticmethod
+    def table(results: Iterable[ProbeResult]) -> Table:
+        """Summarise the probe results in a table."""
+
+        def _mark(value: Optional[bool]) -> str:
+            if value is None:
+                return "[dim]-[/]"
+            return "[green]✓[/]" if value else "[red]✗[/]"
+
+        table = Table(title="Pre-flight check", title_justify="left")
+        table.add_column("Host", no_wrap=True)
+        for column in ("Services", "User", "SSH", "Sudo"):
+            table.add_column(column)
+        table.add_column("Time", justify="right")
+        table.add_column("Message", overflow="fold")
+        for result in results:
+            target = result.target
+            user = target.user
+            if target.become_user:
+                user += f" → {target.become_user}"
+            table.add_row(
+                target.host,
+                ", ".join(target.services),
+                user,
+                _mark(result.ssh),
+                _mark(result.sudo),
+                f"{result.duration:.1f}s",
+                result.message,
+                style=None if result.ok else "bold",
+            )
+        return table
+
+    def report(self, console: Console) -> List[ProbeResult]:
+        """Probe all targets and print the results."""
+        with console.status(
+            f"Checking {len(self.targets)} host connection(s) ..."
+        ):
+            results = self.run()
+        if results:
+            console.print(self.table(results))
+        return results
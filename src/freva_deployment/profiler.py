@@ -0,0 +1,288 @@
+"""Timing of the tasks of a deployment."""
+
+from __future__ import annotations
+
+import json
+import os
+from itertools import groupby
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, NamedTuple, Tuple
+
+from rich.console import Group
+from rich.table import Table
+
+
+class TaskTiming(NamedTuple):
+    """Start and end of a task on a single host."""
+
+    task: str
+    role: str
+    host: str
+    status: str
+    start: float
+    end: float
+    play: str = ""
+
+    @property
+    def duration(self) -> float:
+        """Seconds the task took on the host."""
+        return self.end - self.start
+
+
+def read_profile(path: Path) -> List[TaskTiming]:
+    """Read the task timings of a profile file, if it exists."""
+    try:
+        tasks = json.loads(Path(path).read_text())["tasks"]
+    except (FileNotFoundError, json.JSONDecodeError, KeyError):
+        return []
+    return [TaskTiming(**task) for task in tasks]
+
+
+def summarise(timings: Iterable[TaskTiming], top: int = 10) -> Dict[str, Any]:
+    """Summarise the slowest tasks and the time of each role and host.
+
+    Parameters
+    ----------
+    timings: Iterable[TaskTiming]
+        The timings of all tasks.
+    top: int, default: 10
+        Number of slowest tasks that are listed.
+
+    Returns
+    -------
+    dict: The wall time of the whole run, the slowest tasks and the summed
+          up and wall times of the roles and hosts.
+    """
+    timings = list(timings)
+    if not timings:
+        return {"total": 0.0, "slowest": [], "roles": [], "hosts": []}
+    groups: Dict[str, Dict[str, List[TaskTiming]]] = {"roles": {}, "hosts": {}}
+    for timing in timings:
+        groups["roles"].setdefault(timing.role or "-", []).append(timing)
+        groups["hosts"].setdefault(timing.host, []).append(timing)
+    summary: Dict[str, Any] = {
+        "total": max(t.end for t in timings) - min(t.start for t in timings),
+        "slowest": [
+            {**t._asdict(), "duration": t.duration}
+            for t in sorted(timings, key=lambda t: t.duration, reverse=True)[
+                :top
+            ]
+        ],
+    }
+    for kind, key in (("roles", "role"), ("hosts", "host")):
+        summary[kind] = sorted(
+            (
+                {
+                    key: name,
+                    "tasks": len(group),
+                    "time": sum(t.duration for t in group),
+                    "wall": max(t.end for t in group)
+                    - min(t.start for t in group),
+                }
+                for name, group in groups[kind].items()
+            ),
+            key=lambda entry: entry["time"],
+            reverse=True,
+        )
+    return summary
+
+
+def write_profile(path: Path, timings: Iterable[TaskTiming]) -> None:
+    """Atomically write the timings and their summary as json."""
+    timings = list(timings)
+    path = Path(path)
+    path.parent.mkdir(exist_ok=True, parents=True)
+    temp_file = path.with_suffix(f".{os.getpid()}.tmp")
+    temp_file.write_text(
+        json.dumps(
+            {
+                "tasks": [t._asdict() for t in timings],
+                "summary": summarise(timings),
+            },
+            indent=1,
+        )
+    )
+    os.replace(temp_file, path)
+
+
+def profile_report(summary: Dict[str, Any]) -> Group:
+    """Display the summary of a profile as tables."""
+    slowest = Table(
+        title=f"Slowest tasks (total: {summary['total']:.1f}s)",
+        title_justify="left",
+    )
+    for column in ("Task", "Role", "Host", "Status"):
+        slowest.add_column(column)
+    slowest.add_column("Time", justify="right")
+    for task in summary["slowest"]:
+        slowest.add_row(
+            task["task"],
+            task["role"] or "-",
+            task["host"],
+            task["status"],
+            f"{task['duration']:.1f}s",
+        )
+    tables = [slowest]
+    for kind, key in (("roles", "role"), ("hosts", "host")):
+        table = Table(title=f"Time per {key}", title_justify="left")
+        table.add_column(key.capitalize())
+        for column in ("Tasks", "Task time", "Wall time"):
+            table.add_column(column, justify="right")
+        for entry in summary[kind]:
+            table.add_row(
+                entry[key],
+                str(entry["tasks"]),
+                f"{entry['time']:.1f}s",
+                f"{entry['wall']:.1f}s",
+            )
+        tables.append(table)
+    return Group(*tables)
+
+
+def _assign_lanes(intervals: List[Tuple[float, float]]) -> List[int]:
+    """Put overlapping intervals into different lanes, reusing free ones."""
+    lane_ends: List[float] = []
+    lanes = [0] * len(intervals)
+    for idx in sorted(range(len(intervals)), key=lambda i: intervals[i]):
+        start, end = intervals[idx]
+        for lane, lane_end in enumerate(lane_ends):
+            if lane_end <= start:
+                break
+        else:
+            lane = len(lane_ends)
+            lane_ends.append(end)
+        lane_ends[lane] = end
+        lanes[idx] = lane
+    return lanes
+
+
+def trace_events(timings: Iterable[TaskTiming]) -> Dict[str, Any]:
+    """Convert task timings to the chrome trace event format.
+
+    The trace has two processes. *Hosts* has a lane per host with the
+    plays, roles and tasks as nested slices; plays of parallel playbook
+    runs that overlap on a host get an extra lane. *Workers* packs all
+    tasks into as few lanes as possible, which shows how many tasks ran
+    at the same time.
+
+    Parameters
+    ----------
+    timings: Iterable[TaskTiming]
+        The timings of all tasks.
+
+    Returns
+    -------
+    dict: The trace, which can be opened with Perfetto or chrome://tracing.
+    """
+    timings = sorted(timings, key=lambda t: (t.start, t.end))
+    if not timings:
+        return {"traceEvents": [], "displayTimeUnit": "ms"}
+    origin = timings[0].start
+    colours = {
+        "failed": "terrible",
+        "unreachable": "terrible",
+        "skipped": "grey",
+    }
+
+    def _slice(
+        name: str, cat: str, pid: int, tid: int, start: float, end: float
+    ) -> Dict[str, Any]:
+        ts = round((start - origin) * 1e6)
+        return {
+            "name": name,
+            "cat": cat,
+            "ph": "X",
+            "pid": pid,
+            "tid": tid,
+            "ts": ts,
+            "dur": round((end - origin) * 1e6) - ts,
+        }
+
+    def _name(pid: int, tid: int, name: str) -> List[Dict[str, Any]]:
+        return [
+            {
+                "name": "thread_name",
+                "ph": "M",
+                "pid": pid,
+                "tid": tid,
+                "args": {"name": name},
+            },
+            {
+                "name": "thread_sort_index",
+                "ph": "M",
+                "pid": pid,
+                "tid": tid,
+                "args": {"sort_index": tid},
+            },
+        ]
+
+    events: List[Dict[str, Any]] = [
+        {"name": "process_name", "ph": "M", "pid": pid, "args": {"name": n}}
+        for pid, n in ((1, "Hosts"), (2, "Workers"))
+    ]
+    # Tasks of plays that run concurrently on a host are interleaved in
+    # time, hence they are grouped by play before they are put into lanes.
+    host_plays: Dict[Tuple[str, str], List[TaskTiming]] = {}
+    for timing in timings:
+        host_plays.setdefault((timing.host, timing.play), []).append(timing)
+    tid = 0
+    for host in sorted({host for host, _ in host_plays}):
+        plays = [tasks for (h, _), tasks in host_plays.items() if h == host]
+        lanes = _assign_lanes(
+            [(p[0].start, max(t.end for t in p)) for p in plays]
+        )
+        for lane in range(max(lanes) + 1):
+            events += _name(
+                1, tid + lane, host if not lane else f"{host} #{lane + 1}"
+            )
+        for play, lane in zip(plays, lanes):
+            end = max(t.end for t in play)
+            events.append(
+                _slice(
+                    play[0].play or "play",
+                    "play",
+                    1,
+                    tid + lane,
+                    play[0].start,
+                    end,
+                )
+            )
+            for role, group in groupby(play, key=lambda t: t.role):
+                tasks = list(group)
+                if role:
+                    events.append(
+                        _slice(
+                            role,
+                            "role",
+                            1,
+                            tid + lane,
+                            tasks[0].start,
+                            max(t.end for t in tasks),
+                        )
+                    )
+                for task in tasks:
+                    event = _slice(
+                        task.task, "task", 1, tid + lane, task.start, task.end
+                    )
+                    event["args"] = {"status": task.status, "role": role}
+                    if task.status in colours:
+                        event["cname"] = colours[task.status]
+                    events.append(event)
+        tid += max(lanes) + 1
+    lanes = _assign_lanes([(t.start, t.end) for t in timings])
+    for lane in range(max(lanes) + 1):
+        events += _name(2, lane, f"worker {lane + 1}")
+    for task, lane in zip(timings, lanes):
+        event = _slice(task.task, "task", 2, lane, task.start, task.end)
+        event["args"] = {"host": task.host, "status": task.status}
+        events.append(event)
+    return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+
+def write_trace(path: Path, timings: Iterable[TaskTiming]) -> None:
+    """Atomically write the timings as chrome trace event json."""
+    path = Path(path)
+    path.parent.mkdir(exist_ok=True, parents=True)
+    temp_file = path.with_suffix(f".{os.getpid()}.tmp")
+    temp_file.write_text(json.dumps(trace_events(timings)))
+    os.replace(temp_file, path)
@@ -1,15 +1,29 @@
 """Ansible runner interaction."""
 
+import asyncio
 import atexit
+import gzip
 import json
 import os
 import sys
-from copy import deepcopy
+import zlib
+from contextlib import nullcontext
+from fnmatch import fnmatch
 from getpass import getuser
 from multiprocessing import get_context
 from pathlib import Path
 from tempfile import NamedTemporaryFile, TemporaryDirectory
-from typing import Any, Dict, List, Optional, Union
+from typing import (
+    Any,
+    AsyncIterator,
+    Dict,
+    Iterator,
+    List,
+    NamedTuple,
+    Optional,
+    Tuple,
+    Union,
+)
 
 import paramiko
 import yaml
@@ -20,8 +34,135 @@ from rich.spinner import Spinner
 
 from .error import DeploymentError
 from .logger import logger
+from .profiler import TaskTiming, read_profile
 from .utils import is_bundeled
 
+SSH_MULTIPLEX_ARGS = "-o ControlMaster=auto -o ControlPersist=60s"
+"""Ssh options that keep a connection to a host open for reuse."""
+
+
+def read_log(path: Path) -> str:
+    """Read a, possibly compressed, log file of the deployment plugin."""
+    content = path.read_bytes()
+    if content[:2] == b"\x1f\x8b":
+        content = gzip.decompress(content)
+    elif content[:4] == b"\x28\xb5\x2f\xfd":
+        import zstandard
+
+        with zstandard.ZstdDecompressor().stream_reader(content) as stream:
+            content = stream.read()
+    return content.decode("utf-8", errors="replace")
+
+
+class TaskEvent(NamedTuple):
+    """A single task result of a playbook run."""
+
+    task: str
+    host: str
+    result: Dict[str, Any]
+
+    def matches(
+        self, task: Optional[str] = None, host: Optional[str] = None
+    ) -> bool:
+        """Check if task name and host match the given glob patterns."""
+        if task and not fnmatch(self.task.lower(), task.lower()):
+            return False
+        if host and not fnmatch(self.host, host):
+            return False
+        return True
+
+
+class LogReader:
+    """Incrementally read the, possibly compressed, log of a playbook run.
+
+    Every call of :py:meth:`read` only decodes the part of the log that
+    was written since the previous call, hence the log can be followed
+    while the playbook is still running without ever holding the whole
+    log in memory.
+
+    Parameters
+    ----------
+    path: Path
+        Path to the log file.
+    chunk_size: int, default: 1 MB
+        Number of bytes that are read at once.
+    """
+
+    def __init__(self, path: Path, chunk_size: int = 1024**2) -> None:
+        self.path = Path(path)
+        self.chunk_size = chunk_size
+        self._offset = 0
+        self._head = b""
+        self._pending = b""
+        self._compressed: Optional[bool] = None
+        self._decoder: Optional[Any] = None
+
+    def _decode(self, chunk: bytes) -> bytes:
+        if self._compressed is None:
+            self._head += chunk
+            if len(self._head) < 4:
+                return b""
+            chunk, self._head = self._head, b""
+            if chunk[:2] == b"\x1f\x8b":
+                self._decoder = zlib.decompressobj(zlib.MAX_WBITS | 16)
+            elif chunk[:4] == b"\x28\xb5\x2f\xfd":
+                import zstandard
+
+                self._decoder = zstandard.ZstdDecompressor().decompressobj()
+            self._compressed = self._decoder is not None
+        if self._decoder is None:
+            return chunk
+        return self._decoder.decompress(chunk)
+
+    def read(
+        self, task: Optional[str] = None, host: Optional[str] = None
+    ) -> Iterator[TaskEvent]:
+        """Yield the task results that were written since the last call.
+
+        Parameters
+        ----------
+        task: str, default: None
+            Only yield results of tasks whose name match this glob pattern.
+        host: str, default: None
+            Only yield results of hosts that match this glob pattern.
+        """
+        with open(self.path, "rb") as stream:
+            stream.seek(self._offset)
+            for chunk in iter(lambda: stream.read(self.chunk_size), b""):
+                self._offset += len(chunk)
+                *lines, self._pending = (
+                    self._pending + self._decode(chunk)
+                ).split(b"\n")
+                for line in lines:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue
+                    event = TaskEvent(
+                        entry.get("task", ""),
+                        entry.get("host", ""),
+                        entry.get("result", {}),
+                    )
+                    if event.matches(task, host):
+                        yield event
+
+
+def iter_log(
+    path: Path, task: Optional[str] = None, host: Optional[str] = None
+) -> Iterator[TaskEvent]:
+    """Iterate over the task results of a finished playbook run.
+
+    Parameters
+    ----------
+    path: Path
+        Path to the log file.
+    task: str, default: None
+        Only yield results of tasks whose name match this glob pattern.
+    host: str, default: None
+        Only yield results of hosts that match this glob pattern.
+    """
+    yield from LogReader(path).read(task=task, host=host)
+
 
 def _del_path(inp_path: Path) -> None:
     tmp_path = inp_path.with_suffix(".cfg.tmp")
@@ -36,26 +177,156 @@ class SubProcess:
     """Class that holds the exitcode and the stdout of a process."""
 
     def __init__(
-        self, exitcode: Optional[int], stdout: str = "", log: str = ""
+        self,
+        exitcode: Optional[int],
+        stdout: str = "",
+        log: str = "",
+        timings: Optional[List[TaskTiming]] = None,
     ) -> None:
         self.returncode = exitcode or 0
         self.stdout = stdout
         self.log = log
+        self.timings = timings or []
 
     @classmethod
     def run_ansible_playbook(
         cls,
         cwd: Path,
         command: List[str],
+        env: Optional[Dict[str, str]] = None,
+        stdout_file: Optional[str] = None,
     ) -> None:
         from ansible.cli.playbook import main
 
         current_dir = os.path.abspath(os.curdir)
+        os.environ.update(env or {})
+        if stdout_file:
+            sys.stdout = open(stdout_file, "w")
         try:
             os.chdir(cwd)
             main(command)
         finally:
             os.chdir(current_dir)
+            if stdout_file:
+                sys.stdout.close()
+
+
+class AnsibleProcess:
+    """An ansible-playbook run in a child process.
+
+    The child process is started without blocking, which allows for
+    supervising several playbook runs at the same time.
+
+    Parameters
+    ----------
+    cwd: str
+        The working directory of the playbook run.
+    command: list[str]
+        The ansible-playbook command line.
+    env: dict[str, str], default: None
+        Additional environment variables for the child process.
+    capture_output: bool, default: False
+        Write the stdout of the child into a file instead of the terminal.
+    """
+
+    def __init__(
+        self,
+        cwd: str,
+        command: List[str],
+        env: Optional[Dict[str, str]] = None,
+        capture_output: bool = False,
+    ) -> None:
+        self._temp_dir = TemporaryDirectory(prefix="AnsibleRunner")
+        self.logger_file = Path(self._temp_dir.name) / "logger.log"
+        self.logger_file.touch()
+        self.stdout_file = Path(self._temp_dir.name) / "stdout.log"
+        self.stdout_file.touch()
+        env = dict(env or {})
+        env["DEPLOYMENT_LOG_PATH"] = str(self.logger_file)
+        stdout_file = str(self.stdout_file) if capture_output else None
+        self.proc = get_context().Process(
+            target=SubProcess.run_ansible_playbook,
+            args=(cwd, command, env, stdout_file),
+        )
+
+    def start(self) -> None:
+        """Start the child process."""
+        self.proc.start()
+
+    @property
+    def sentinel(self) -> int:
+        """Handle that becomes ready once the child process has finished."""
+        return self.proc.sentinel
+
+    def join(self, timeout: Optional[float] = None) -> None:
+        """Wait for the child process to finish."""
+        self.proc.join(timeout)
+
+    def terminate(self) -> None:
+        """Stop a running child process."""
+        if self.proc.is_alive():
+            self.proc.terminate()
+            self.proc.join()
+
+    def events(
+        self,
+        task: Optional[str] = None,
+        host: Optional[str] = None,
+        poll_interval: float = 0.2,
+    ) -> Iterator[TaskEvent]:
+        """Yield the task results of the started process as they come in.
+
+        Parameters
+        ----------
+        task: str, default: None
+            Only yield results of tasks whose name match this glob pattern.
+        host: str, default: None
+            Only yield results of hosts that match this glob pattern.
+        poll_interval: float, default: 0.2
+            Seconds to wait for new results.
+        """
+        reader = LogReader(self.logger_file)
+        while True:
+            alive = self.proc.is_alive()
+            yield from reader.read(task=task, host=host)
+            if not alive:
+                break
+            self.proc.join(poll_interval)
+
+    async def aevents(
+        self,
+        task: Optional[str] = None,
+        host: Optional[str] = None,
+        poll_interval: float = 0.2,
+    ) -> AsyncIterator[TaskEvent]:
+        """Asynchronous version of :py:meth:`events`."""
+        reader = LogReader(self.logger_file)
+        while True:
+            alive = self.proc.is_alive()
+            for event in reader.read(task=task, host=host):
+                yield event
+            if not alive:
+                break
+            await asyncio.sleep(poll_interval)
+
+    def result(self, with_log: bool = True) -> SubProcess:
+        """Collect the exit code, stdout and log of the finished process.
+
+        Parameters
+        ----------
+        with_log: bool, default: True
+            Read the whole log, consumers of :py:meth:`events` can skip it.
+        """
+        result = SubProcess(
+            self.proc.exitcode,
+            stdout=self.stdout_file.read_text(),
+            log=read_log(self.logger_file) if with_log else "",
+            timings=read_profile(
+                self.logger_file.with_suffix(".profile.json")
+            ),
+        )
+        self._temp_dir.cleanup()
+        return result
 
 
 def run_command(
@@ -63,35 +334,40 @@ def run_command(
     command: List[str],
     env: Optional[Dict[str, str]] = None,
     capture_output: bool = False,
-):
-    os_env = deepcopy(os.environ)
-    env = env or {}
-    stdout = sys.stdout
-    with TemporaryDirectory(prefix="AnsibleRunner") as temp_dir:
-        logger_file = Path(temp_dir) / "logger.log"
-        logger_file.touch()
-        stdout_file = Path(temp_dir) / "stdout.log"
-        env["DEPLOYMENT_LOG_PATH"] = str(logger_file)
-        stdout_buffer = stdout_file.open("w")
+) -> SubProcess:
+    proc = AnsibleProcess(cwd, command, env=env, capture_output=capture_output)
+    try:
+        proc.start()
+        proc.join()
+    finally:
+        proc.terminate()
+    return proc.result()
+
+
+def ssh_handshakes_saved(log: str) -> int:
+    """Estimate the number of ssh handshakes saved by connection reuse.
+
+    Without connection reuse every task opens at least one new ssh
+    connection to its host, with reuse each host needs only one.
+
+    Parameters
+    ----------
+    log: str
+        The json log of a playbook run.
+
+    Returns
+    -------
+    int: The number of saved ssh handshakes.
+    """
+    tasks: Dict[str, int] = {}
+    for line in log.splitlines():
         try:
-            os.environ.update(env)
-            if capture_output:
-                sys.stdout = stdout_buffer
-            ctx = get_context()
-            proc = ctx.Process(
-                target=SubProcess.run_ansible_playbook, args=(cwd, command)
-            )
-            proc.start()
-            proc.join()
-        finally:
-            os.environ = os_env
-            sys.stdout = stdout
-            stdout_buffer.close()
-        return SubProcess(
-            proc.exitcode,
-            stdout=stdout_file.read_text(),
-            log=logger_file.read_text(),
-        )
+            host = json.loads(line).get("host")
+        except json.JSONDecodeError:
+            continue
+        if host:
+            tasks[host] = tasks.get(host, 0) + 1
+    return sum(num - 1 for num in tasks.values())
 
 
 def run_command_with_spinner(
@@ -126,6 +402,8 @@ class RunnerDir(TemporaryDirectory):
         self.aux_file_dir = self.parent_dir / "files"
         for _dir in (self.env_dir, self.inventory_dir, self.project_dir):
             _dir.mkdir(exist_ok=True, parents=True)
+        self.timings: List[TaskTiming] = []
+        """Timings of the tasks of all playbook runs."""
 
         self.ansible_config_file = Path(
             os.getenv("ANSIBLE_CONFIG") or self.parent_dir / "ansible.cfg"
@@ -136,17 +414,84 @@ class RunnerDir(TemporaryDirectory):
             )
         atexit.register(_del_path, self.ansible_config_file)
 
-    def create_config(self, **kwargs: str) -> None:
-        """Create an ansible config."""
+    @property
+    def control_path_dir(self) -> Path:
+        """Directory holding the persistent ssh control sockets."""
+        return self.parent_dir / "cp"
+
+    def create_config(
+        self, ssh_connection: Optional[Dict[str, str]] = None, **kwargs: str
+    ) -> None:
+        """Create an ansible config.
+
+        Parameters
+        ----------
+        ssh_connection: dict[str, str], default: None
+            Settings of the ``[ssh_connection]`` section.
+        **kwargs:
+            Settings of the ``[defaults]`` section.
+        """
         self.ansible_config_file.parent.mkdir(exist_ok=True, parents=True)
         with open(self.ansible_config_file, "w", encoding="utf-8") as stream:
             stream.write("[defaults]\n")
             for key, value in kwargs.items():
                 stream.write(f"{key} = {value}\n")
+            if ssh_connection:
+                stream.write("[ssh_connection]\n")
+                for key, value in ssh_connection.items():
+                    stream.write(f"{key} = {value}\n")
             stream.write("[colors]\n")
             stream.write("included = purple\n")
             stream.write("skip = green\n")
 
+    def fast_transport_config(self, pipelining: bool = True) -> Dict[str, str]:
+        """Define the ssh settings that reuse connections to the hosts.
+
+        Ansible tasks are piped through one persistent ssh connection per
+        host instead of opening new connections for every task. The control
+        sockets live in the runner dir, hence all playbook runs of a
+        deployment share them.
+
+        Parameters
+        ----------
+        pipelining: bool, default: True
+            Pipe the modules through the ssh connection instead of copying
+            them to the host first.
+        """
+        self.control_path_dir.mkdir(exist_ok=True, parents=True)
+        config = {
+            "control_path_dir": str(self.control_path_dir),
+            "ssh_args": SSH_MULTIPLEX_ARGS,
+        }
+        if pipelining:
+            config["pipelining"] = "True"
+        return config
+
+    @staticmethod
+    def fact_cache_config(
+        cache_dir: Path, timeout: int = 86400, smart: bool = True
+    ) -> Dict[str, str]:
+        """Define the settings of a persistent fact cache.
+
+        Parameters
+        ----------
+        cache_dir: Path
+            Directory holding the cached facts of the hosts.
+        timeout: int, default: 86400
+            Seconds after which cached facts are gathered again.
+        smart: bool, default: True
+            Only gather facts of hosts that have no cached facts.
+        """
+        cache_dir.mkdir(exist_ok=True, parents=True)
+        config = {
+            "fact_caching": "jsonfile",
+            "fact_caching_connection": str(cache_dir),
+            "fact_caching_timeout": str(timeout),
+        }
+        if smart:
+            config["gathering"] = "smart"
+        return config
+
     def create_playbook(self, content: List[Dict[str, Any]]) -> str:
         """Dump the content of a playbook into the playbook file."""
         for nn, step in enumerate(content):
@@ -260,26 +605,21 @@ class RunnerDir(TemporaryDirectory):
             ssh.close()
         return file_content
 
-    def run_ansible_playbook(
+    def build_command(
         self,
         playbook: Optional[Union[str, Path, List[Any], Dict[str, Any]]],
         inventory: Optional[Union[str, Path, List[Any], Dict[str, Any]]],
-        working_dir: Optional[Union[str, Path]] = None,
         envvars: Optional[Dict[str, str]] = None,
         extravars: Optional[Dict[str, str]] = None,
         tags: Optional[List[str]] = None,
         cmdline: Optional[str] = None,
         verbosity: int = 0,
         passwords: Optional[Dict[str, str]] = None,
-        hide_output: bool = False,
-        text: str = "Running playbook ...",
-        output: str = "",
-    ) -> str:
+    ) -> Tuple[List[str], Dict[str, str]]:
         """
-        Run an Ansible playbook using multiprocessing.
+        Construct the ansible-playbook command and its environment.
 
         Parameters:
-        working_dir (str): Current working directory for the playbooks.
         playbook_path (str): Path to the playbook.
         inventory_path (str): Path to the inventory file.
         envvars (Optional[Dict[str, str]]): Environment variables to set for Ansible.
@@ -287,18 +627,16 @@ class RunnerDir(TemporaryDirectory):
         cmdline (Optional[str]): Extra command line arguments for Ansible.
         verbosity (int): Verbosity level for Ansible output.
         tags (Optional[List[str]]): The roles that should be involved.
-        hide_output (bool): Hide stdout and stderr if True, show only on failure.
 
-        Raises:
-        DeploymentError: If the Ansible playbook execution fails.
+        Returns:
+        tuple: The command line and the environment variables of the run.
         """
         tags = tags or []
-        working_dir = Path(working_dir or "").expanduser().absolute()
         playbook_path = self.convert_to_file(playbook or "")
         inventory_path = self.convert_to_file(inventory or "")
         passwords = passwords or {}
-        extravars = extravars or {}
-        envvars = envvars or {}
+        extravars = dict(extravars or {})
+        envvars = dict(envvars or {})
         # Prepare the command
 
         command = ["ansible-playbook", playbook_path, "-i", inventory_path]
@@ -322,6 +660,51 @@ class RunnerDir(TemporaryDirectory):
         # Add verbosity
         if verbosity > 0:
             command.append("-" + "v" * verbosity)
+        return command, envvars
+
+    def run_ansible_playbook(
+        self,
+        playbook: Optional[Union[str, Path, List[Any], Dict[str, Any]]],
+        inventory: Optional[Union[str, Path, List[Any], Dict[str, Any]]],
+        working_dir: Optional[Union[str, Path]] = None,
+        envvars: Optional[Dict[str, str]] = None,
+        extravars: Optional[Dict[str, str]] = None,
+        tags: Optional[List[str]] = None,
+        cmdline: Optional[str] = None,
+        verbosity: int = 0,
+        passwords: Optional[Dict[str, str]] = None,
+        hide_output: bool = False,
+        text: str = "Running playbook ...",
+        output: str = "",
+    ) -> str:
+        """
+        Run an Ansible playbook using multiprocessing.
+
+        Parameters:
+        working_dir (str): Current working directory for the playbooks.
+        playbook_path (str): Path to the playbook.
+        inventory_path (str): Path to the inventory file.
+        envvars (Optional[Dict[str, str]]): Environment variables to set for Ansible.
+        extravars (Optional[Dict[str, str]]): Extra variables to pass to Ansible.
+        cmdline (Optional[str]): Extra command line arguments for Ansible.
+        verbosity (int): Verbosity level for Ansible output.
+        tags (Optional[List[str]]): The roles that should be involved.
+        hide_output (bool): Hide stdout and stderr if True, show only on failure.
+
+        Raises:
+        DeploymentError: If the Ansible playbook execution fails.
+        """
+        working_dir = Path(working_dir or "").expanduser().absolute()
+        command, envvars = self.build_command(
+            playbook,
+            inventory,
+            envvars=envvars,
+            extravars=extravars,
+            tags=tags,
+            cmdline=cmdline,
+            verbosity=verbosity,
+            passwords=passwords,
+        )
         logger.debug("Running ansible command %s", " ".join(command))
         # Run the command
         if hide_output and verbosity == 0:
@@ -333,6 +716,7 @@ class RunnerDir(TemporaryDirectory):
                 str(working_dir), command, env=envvars, capture_output=False
             )
 
+        self.timings += result.timings
         # Determine if the command was successful
         success = result.returncode == 0
         # Raise an error if the playbook execution failed
@@ -340,3 +724,80 @@ class RunnerDir(TemporaryDirectory):
             pprint(result.stdout)
             raise DeploymentError("Deployment failed!")
         return result.log
+
+    def stream_ansible_playbook(
+        self,
+        playbook: Optional[Union[str, Path, List[Any], Dict[str, Any]]],
+        inventory: Optional[Union[str, Path, List[Any], Dict[str, Any]]],
+        working_dir: Optional[Union[str, Path]] = None,
+        envvars: Optional[Dict[str, str]] = None,
+        extravars: Optional[Dict[str, str]] = None,
+        tags: Optional[List[str]] = None,
+        cmdline: Optional[str] = None,
+        verbosity: int = 0,
+        passwords: Optional[Dict[str, str]] = None,
+        hide_output: bool = False,
+        text: str = "Running playbook ...",
+        task: Optional[str] = None,
+        host: Optional[str] = None,
+    ) -> Iterator[TaskEvent]:
+        """
+        Run an Ansible playbook and yield the task results as they come in.
+
+        Unlike :py:meth:`run_ansible_playbook` the log is never loaded as
+        a whole. Stopping the iteration early stops the playbook run.
+
+        Parameters:
+        working_dir (str): Current working directory for the playbooks.
+        playbook_path (str): Path to the playbook.
+        inventory_path (str): Path to the inventory file.
+        envvars (Optional[Dict[str, str]]): Environment variables to set for Ansible.
+        extravars (Optional[Dict[str, str]]): Extra variables to pass to Ansible.
+        cmdline (Optional[str]): Extra command line arguments for Ansible.
+        verbosity (int): Verbosity level for Ansible output.
+        tags (Optional[List[str]]): The roles that should be involved.
+        hide_output (bool): Hide stdout and stderr if True, show only on failure.
+        task (Optional[str]): Glob pattern the yielded task names must match.
+        host (Optional[str]): Glob pattern the yielded hosts must match.
+
+        Raises:
+        DeploymentError: If the Ansible playbook execution fails.
+        """
+        working_dir = Path(working_dir or "").expanduser().absolute()
+        command, envvars = self.build_command(
+            playbook,
+            inventory,
+            envvars=envvars,
+            extravars=extravars,
+            tags=tags,
+            cmdline=cmdline,
+            verbosity=verbosity,
+            passwords=passwords,
+        )
+        logger.debug("Running ansible command %s", " ".join(command))
+        capture_output = hide_output and verbosity == 0
+        proc = AnsibleProcess(str(working_dir), command, envvars, capture_output)
+        spinner = Spinner("weather", text=text)
+        live = (
+            Live(spinner, refresh_per_second=3, console=Console(stderr=True))
+            if capture_output
+            else nullcontext()
+        )
+        with live:
+            try:
+                proc.start()
+                yield from proc.events(task=task, host=host)
+            except KeyboardInterrupt:
+                spinner.update(text=text + " [yellow]canceled[/yellow]")
+                raise KeyboardInterrupt("User interrupted execution") from None
+            finally:
+                proc.terminate()
+            result = proc.result(with_log=False)
+            self.timings += result.timings
+            if result.returncode == 0:
+                spinner.update(text=text + " [green]ok[/green]")
+            else:
+                spinner.update(text=text + " [red]failed[/red]")
+        if result.returncode != 0:
+            pprint(result.stdout)
+            raise DeploymentError("Deployment failed!")
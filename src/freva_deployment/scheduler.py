@@ -0,0 +1,283 @@
+"""Run the plays of the main deployment playbook concurrently."""
+
+from __future__ import annotations
+
+import shutil
+import sys
+from multiprocessing.connection import wait
+from pathlib import Path
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple, cast
+
+import yaml
+from rich.console import Console, Group
+from rich.live import Live
+from rich.spinner import Spinner
+
+from .error import DeploymentError
+from .logger import logger
+from .runner import AnsibleProcess, RunnerDir, SubProcess
+
+PLAY_DEPENDENCIES: Dict[str, Tuple[str, ...]] = {
+    "Pre-pull container images": (),
+    "Deploy Freva Core Library": (),
+    "Deploy Database": (),
+    "Deploy Vault": ("Deploy Database",),
+    "Setup cache server": (),
+    "Setup data-loader scheduler": ("Setup cache server",),
+    "Setup data-loader worker": ("Setup data-loader scheduler",),
+    "Setup mongodb server": (),
+    "Setup search backend": (),
+    "Deploy Freva Rest API": (
+        "Deploy Vault",
+        "Setup cache server",
+        "Setup mongodb server",
+        "Setup search backend",
+    ),
+    "Prepare Web App": ("Deploy Freva Core Library",),
+    "Deploy Web App": (
+        "Prepare Web App",
+        "Deploy Vault",
+        "Deploy Freva Rest API",
+    ),
+    "Restarting the web service": (
+        "Deploy Web App",
+        "Deploy Vault",
+        "Deploy Freva Rest API",
+    ),
+    "Add monogDB secrets to vault": ("Deploy Vault", "Deploy Freva Rest API"),
+}
+"""Plays that have to be finished before a given play can start.
+
+Plays that are not listed here depend on all plays that are defined
+before them in the playbook, which is the ansible default.
+"""
+
+
+class PlayNode(NamedTuple):
+    """A single play of the deployment playbook."""
+
+    name: str
+    play: Dict[str, Any]
+    requires: Tuple[str, ...]
+
+
+class PlayScheduler:
+    """Run the plays of a playbook as a dependency graph.
+
+    Independent plays are executed in concurrent ansible-playbook processes.
+    A play is started as soon as all the plays it depends on have
+    successfully finished. The logs and the exit status of all runs are
+    merged once every play is done.
+
+    Parameters
+    ----------
+    playbook: Path
+        Path to the playbook that should be split into its plays.
+    inventory: str
+        The inventory of the deployment.
+    tags: list[str], default: None
+        Only plays carrying any of these tags are considered.
+    max_jobs: int, default: 4
+        Maximum number of ansible-playbook processes running at a time.
+    """
+
+    def __init__(
+        self,
+        playbook: Path,
+        inventory: str,
+        tags: Optional[List[str]] = None,
+        max_jobs: int = 4,
+    ) -> None:
+        self.playbook = Path(playbook)
+        self.inventory = inventory
+        self.max_jobs = max(max_jobs, 1)
+        groups = set((yaml.safe_load(inventory) or {}).keys())
+        self.nodes = self._build_graph(
+            yaml.safe_load(self.playbook.read_text()), groups, tags
+        )
+
+    @staticmethod
+    def _build_graph(
+        playbook: List[Dict[str, Any]],
+        groups: set[str],
+        tags: Optional[List[str]],
+    ) -> Dict[str, PlayNode]:
+        """Create the dependency graph of the selected plays."""
+        defined: List[str] = []
+        nodes: Dict[str, PlayNode] = {}
+        for play in playbook:
+            name = play["name"].strip()
+            requires = PLAY_DEPENDENCIES.get(name, tuple(defined))
+            defined.append(name)
+            if tags and not set(play.get("tags", [])) & set(tags):
+                continue
+            if not set(str(play.get("hosts", "")).split(":")) & groups:
+                continue
+            nodes[name] = PlayNode(name, play, requires)
+        for name, node in nodes.items():
+            nodes[name] = node._replace(
+                requires=tuple(r for r in node.requires if r in nodes)
+            )
+        return nodes
+
+    @property
+    def critical_path(self) -> List[str]:
+        """The longest chain of plays that have to run one after another."""
+        paths: Dict[str, List[str]] = {}
+        for name in self.nodes:
+            self._longest_path(name, paths)
+        return max(paths.values(), key=len, default=[])
+
+    def _longest_path(
+        self, name: str, paths: Dict[str, List[str]]
+    ) -> List[str]:
+        if name not in paths:
+            chains = [
+                self._longest_path(r, paths) for r in self.nodes[name].requires
+            ]
+            paths[name] = max(chains, key=len, default=[]) + [name]
+        return paths[name]
+
+    def _stage_playbooks(self, target_dir: Path) -> Dict[str, Path]:
+        """Write every play into its own playbook file.
+
+        The split playbooks are placed next to links to the content of the
+        original playbook directory so that relative roles, vars files and
+        task includes are resolved like they would be for the original
+        playbook.
+        """
+        target_dir.mkdir(exist_ok=True, parents=True)
+        for source in self.playbook.parent.iterdir():
+            target = target_dir / source.name
+            if target.exists() or source == self.playbook:
+                continue
+            try:
+                target.symlink_to(source, target_is_directory=source.is_dir())
+            except OSError:
+                if source.is_dir():
+                    shutil.copytree(source, target)
+                else:
+                    shutil.copy2(source, target)
+        playbooks = {}
+        for num, (name, node) in enumerate(self.nodes.items()):
+            playbooks[name] = target_dir / f"play-{num:02d}.yml"
+            playbooks[name].write_text(yaml.safe_dump([node.play]))
+        return playbooks
+
+    def _ready(self, done: set[str], started: set[str]) -> List[str]:
+        return [
+            n
+            for n, node in self.nodes.items()
+            if n not in started and set(node.requires) <= done
+        ]
+
+    def run(
+        self,
+        runner: RunnerDir,
+        working_dir: Path,
+        envvars: Optional[Dict[str, str]] = None,
+        extravars: Optional[Dict[str, str]] = None,
+        tags: Optional[List[str]] = None,
+        verbosity: int = 0,
+        passwords: Optional[Dict[str, str]] = None,
+    ) -> str:
+        """Run all plays of the graph.
+
+        Parameters
+        ----------
+        runner: RunnerDir
+            The runner directory of the deployment.
+        working_dir: Path
+            Current working directory for the playbooks.
+        envvars: dict[str, str], default: None
+            Environment variables to set for Ansible.
+        extravars: dict[str, str], default: None
+            Extra variables to pass to Ansible.
+        tags: list[str], default: None
+            The roles that should be involved.
+        verbosity: int, default: 0
+            Verbosity level for Ansible output.
+        passwords: dict[str, str], default: None
+            Passwords for the ssh and sudo connections.
+
+        Returns
+        -------
+        str: The merged logs of all plays.
+
+        Raises
+        ------
+        DeploymentError: If any of the plays failed.
+        """
+        playbooks = self._stage_playbooks(runner.project_dir / "plays")
+        inventory = runner.convert_to_file(self.inventory)
+        logger.debug(
+            "Critical path of the deployment: %s",
+            " -> ".join(self.critical_path),
+        )
+        running: Dict[int, Tuple[str, AnsibleProcess]] = {}
+        spinners: Dict[str, Spinner] = {}
+        results: Dict[str, SubProcess] = {}
+        done: set[str] = set()
+        failed: set[str] = set()
+        started: set[str] = set()
+        with Live(
+            Group(), refresh_per_second=3, console=Console(stderr=True)
+        ) as live:
+            try:
+                while True:
+                    if not failed:
+                        for name in self._ready(done, started):
+                            if len(running) >= self.max_jobs:
+                                break
+                            command, env = runner.build_command(
+                                playbooks[name],
+                                inventory,
+                                envvars=envvars,
+                                extravars=extravars,
+                                tags=tags,
+                                verbosity=verbosity,
+                                passwords=passwords,
+                            )
+                            logger.debug(
+                                "Running ansible command %s", " ".join(command)
+                            )
+                            proc = AnsibleProcess(
+                                str(working_dir), command, env, True
+                            )
+                            proc.start()
+                            started.add(name)
+                            running[proc.sentinel] = (name, proc)
+                            spinners[name] = Spinner("weather", text=name)
+                            live.update(Group(*spinners.values()))
+                    if not running:
+                        break
+                    for sentinel in wait(list(running)):
+                        name, proc = running.pop(cast(int, sentinel))
+                        proc.join()
+                        results[name] = proc.result()
+                        runner.timings += results[name].timings
+                        if results[name].returncode == 0:
+                            done.add(name)
+                            spinners[name].update(text=f"{name} [green]ok[/]")
+                        else:
+                            failed.add(name)
+                            spinners[name].update(
+                                text=f"{name} [red]failed[/]"
+                            )
+            except KeyboardInterrupt:
+                for name, proc in running.values():
+                    proc.terminate()
+                    spinners[name].update(text=f"{name} [yellow]canceled[/]")
+                raise KeyboardInterrupt("User interrupted execution") from None
+        for result in results.values():
+            sys.stdout.write(result.stdout)
+        sys.stdout.flush()
+        skipped = set(self.nodes) - started
+        if failed:
+            if skipped:
+                logger.error(
+                    "Plays not started due to failures: %s",
+                    ", ".join(sorted(skipped)),
+                )
+            raise DeploymentError("Deployment failed!")
+        return "".join(result.log for result in results.values())
@@ -44,6 +44,9 @@ def tui(args: argparse.Namespace) -> None:
         ask_pass = setup.pop("ask_pass")
         ssh_port = setup.pop("ssh_port")
         skip_version_check = setup.pop("skip_version_check", False)
+        fast_transport = setup.pop("fast_transport", False)
+        fact_cache = setup.pop("fact_cache", False)
+        force = setup.pop("force", False)
         with DeployFactory(_cowsay=args.cowsay, **setup) as DF:
             try:
                 DF.play(
@@ -51,6 +54,9 @@ def tui(args: argparse.Namespace) -> None:
                     args.verbose,
                     ssh_port=ssh_port,
                     skip_version_check=skip_version_check,
+                    fast_transport=fast_transport,
+                    fact_cache=fact_cache,
+                    force=force,
                 )
             except KeyboardInterrupt:
                 raise SystemExit(130)
@@ -1,7 +1,6 @@
 from __future__ import annotations
 
 import curses
-import json
 import logging
 import os
 import re
@@ -323,8 +322,7 @@ class BaseForm(npyscreen.FormMultiPageWithMenus, npyscreen.FormWithMenus):
 
     def clear_cache(self):
         """Clear the app cache."""
-        with open(self.parentApp.cache_dir / "freva_deployment.json", "w") as f:
-            json.dump({}, f, indent=3)
+        self.parentApp.write_cache({})
         self.parentApp.reset()
 
     def setTheme(self, theme: str) -> None:
@@ -392,6 +390,7 @@ class BaseForm(npyscreen.FormMultiPageWithMenus, npyscreen.FormWithMenus):
             scroll_exit=True,
         )
         self._add_widgets()
+        self.parentApp.watch_form(self, self.step)
 
 
 class VarForm(npyscreen.FormMultiPageActionWithMenus):
@@ -875,6 +875,7 @@ class RunForm(npyscreen.FormMultiPageAction):
             gen_keys = bool(self.gen_keys.value[0])
         else:
             gen_keys = bool(self.gen_keys.value)
+        gen_keys = gen_keys or bool(self.local_ca.value)
         for key_type, keyfile in cert_files.items():
             key_file = Path(get_current_file_dir(save_file.parent, str(keyfile)))
             for step, deploy_form in self.parentApp._forms.items():
@@ -903,8 +904,12 @@ class RunForm(npyscreen.FormMultiPageAction):
             "config_file": str(save_file) or None,
             "ssh_port": ssh_port,
             "skip_version_check": bool(self.skip_version_check.value),
+            "fast_transport": bool(self.fast_transport.value),
+            "fact_cache": bool(self.fact_cache.value),
+            "force": bool(self.force.value),
             "local_debug": bool(self.local_debug.value),
             "gen_keys": bool(gen_keys),
+            "local_ca": bool(self.local_ca.value),
         }
         self.parentApp.thread_stop.set()
         self.parentApp.exit_application(
@@ -928,6 +933,7 @@ class RunForm(npyscreen.FormMultiPageAction):
             self.parentApp.exit_application
         )
         self._add_widgets()
+        self.parentApp.watch_form(self, "setup")
 
     def _add_widgets(self) -> None:
         """Add the widgets to the form."""
@@ -982,6 +988,13 @@ class RunForm(npyscreen.FormMultiPageAction):
             value=self.parentApp._read_cache("gen_keys", False),
             name=f"{self.num}Generate a pair web certificates, debugging",
         )
+        self.local_ca = self.add_widget_intelligent(
+            npyscreen.RoundCheckBox,
+            max_height=2,
+            editable=True,
+            value=self.parentApp._read_cache("local_ca", False),
+            name=f"{self.num}Issue generated certificates by a deployment CA",
+        )
         self.use_ssh_pw = self.add_widget_intelligent(
             npyscreen.RoundCheckBox,
             max_height=2,
@@ -997,6 +1010,27 @@ class RunForm(npyscreen.FormMultiPageAction):
             value=self.parentApp._read_cache("skip_version_check", False),
             name=f"{self.num}Skip the version check, use with caution",
         )
+        self.fast_transport = self.add_widget_intelligent(
+            npyscreen.RoundCheckBox,
+            max_height=2,
+            editable=True,
+            value=self.parentApp._read_cache("fast_transport", False),
+            name=f"{self.num}Reuse ssh connections (fast transport)",
+        )
+        self.fact_cache = self.add_widget_intelligent(
+            npyscreen.RoundCheckBox,
+            max_height=2,
+            editable=True,
+            value=self.parentApp._read_cache("fact_cache", False),
+            name=f"{self.num}Cache the facts of the hosts",
+        )
+        self.force = self.add_widget_intelligent(
+            npyscreen.RoundCheckBox,
+            max_height=2,
+            editable=True,
+            value=self.parentApp._read_cache("force", False),
+            name=f"{self.num}Redeploy services whose config didn't change",
+        )
         self.ssh_port = self.add_widget_intelligent(
             npyscreen.TitleText,
             name=f"{self.num}If you need to, you can change the ssh port here",
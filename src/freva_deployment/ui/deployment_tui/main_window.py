@@ -4,11 +4,13 @@ deployment setup for a new instance of freva."""
 from __future__ import annotations
 
 import json
+import os
 import signal
 import threading
 import time
+from functools import partial
 from pathlib import Path
-from typing import Any, Dict, List, cast
+from typing import Any, Dict, List, Optional, Set, cast
 
 import appdirs
 import npyscreen
@@ -32,6 +34,8 @@ def interrupt(*args: Any) -> None:
 
 class MainApp(npyscreen.NPSAppManaged):
     config: dict[str, Any] = dict()
+    autosave_delay: float = 1.0
+    """Seconds without any edits before the configuration is saved."""
 
     @property
     def steps(self) -> list[str]:
@@ -49,10 +53,18 @@ class MainApp(npyscreen.NPSAppManaged):
         self.setup: dict[str, Any] = {}
         self._forms: dict[str, BaseForm] = {}
         self.current_form = "core"
-        self.init()
         self._auto_save_active = False
+        self._dirty: Set[str] = set()
+        self._saved_state: Optional[str] = None
+        try:
+            cache_file = self.cache_dir / "freva_deployment.json"
+            self._saved_state = cache_file.read_text()
+        except OSError:
+            pass
+        self._save_lock = threading.RLock()
+        self._save_timer: Optional[threading.Timer] = None
         self.thread_stop = threading.Event()
-        self.start_auto_save()
+        self.init()
         signal.signal(signal.SIGINT, interrupt)
 
     def init(self) -> None:
@@ -77,11 +89,33 @@ class MainApp(npyscreen.NPSAppManaged):
         npyscreen.blank_terminal()
         self.init()
 
-    def start_auto_save(self) -> None:
-        """(Re)-Start the auto save thread."""
-        self._save_thread = threading.Thread(target=self._auto_save)
-        self._save_thread.daemon = True
-        self._save_thread.start()
+    def watch_form(self, form: npyscreen.Form, name: str) -> None:
+        """Mark a form as changed once the value of any of its widgets
+        is edited."""
+        for page in getattr(form, "_pages__", [form._widgets__]):
+            for widget in page:
+                widget.value_changed_callback = partial(self._mark_dirty, name)
+
+    def _mark_dirty(self, name: str, **kwargs: Any) -> None:
+        """Remember a changed form and (re)-schedule the auto save."""
+        with self._save_lock:
+            self._dirty.add(name)
+            if self._save_timer is not None:
+                self._save_timer.cancel()
+            if self.thread_stop.is_set():
+                return
+            self._save_timer = threading.Timer(
+                self.autosave_delay, self._auto_save
+            )
+            self._save_timer.daemon = True
+            self._save_timer.start()
+
+    def _sync_forms(self) -> None:
+        """Read the values of all changed forms into the config."""
+        with self._save_lock:
+            dirty, self._dirty = self._dirty, set()
+        for step in dirty & self._forms.keys():
+            self.config[step] = self._forms[step].check_config(notify=False)
 
     def _add_froms(self) -> None:
         """Add forms to edit the deploy steps to the main window."""
@@ -109,6 +143,8 @@ class MainApp(npyscreen.NPSAppManaged):
         )
         if value is True:
             self.thread_stop.set()
+            if self._save_timer is not None:
+                self._save_timer.cancel()
             while self._auto_save_active is True:
                 time.sleep(0.1)
             self.setNextForm(None)
@@ -128,6 +164,8 @@ class MainApp(npyscreen.NPSAppManaged):
 
     def check_missing_config(self, stop_at_missing: bool = True) -> str | None:
         """Evaluate all forms."""
+        with self._save_lock:
+            self._dirty -= set(self._forms)
         for step, form_obj in self._forms.items():
             cfg = form_obj.check_config(notify=stop_at_missing)
             if cfg is None and stop_at_missing:
@@ -140,17 +178,15 @@ class MainApp(npyscreen.NPSAppManaged):
 
     def _auto_save(self) -> None:
         """Auto save the current configuration."""
+        if self.thread_stop.is_set():
+            return
         self._auto_save_active = True
-        while not self.thread_stop.is_set():
-            time.sleep(0.5)
-            if self.thread_stop.is_set():
-                break
-            try:
-                self.check_missing_config(stop_at_missing=False)
-                self.save_config_to_file()
-            except Exception:
-                pass
-        self._auto_save_active = False
+        try:
+            self._save_config_to_file()
+        except Exception:
+            pass
+        finally:
+            self._auto_save_active = False
 
     def save_dialog(self, *args, **kwargs) -> None:
         """Create a dialoge that allows for saving the config file."""
@@ -216,6 +252,7 @@ class MainApp(npyscreen.NPSAppManaged):
         write_toml_file: bool = False,
         save_file: Path | None = None,
     ) -> Path | None:
+        self._sync_forms()
         cert_files = dict(
             public_keyfile=self._setup_form.public_keyfile.value or "",
             private_keyfile=self._setup_form.private_keyfile.value or "",
@@ -232,6 +269,10 @@ class MainApp(npyscreen.NPSAppManaged):
             ("ssh_pw", self._setup_form.use_ssh_pw.value),
             ("local_debug", self._setup_form.local_debug.value),
             ("gen_keys", self._setup_form.gen_keys.value),
+            ("local_ca", self._setup_form.local_ca.value),
+            ("fast_transport", self._setup_form.fast_transport.value),
+            ("fact_cache", self._setup_form.fact_cache.value),
+            ("force", self._setup_form.force.value),
         ):
             if isinstance(value, list):
                 bools[key] = bool(value[0])
@@ -253,8 +294,7 @@ class MainApp(npyscreen.NPSAppManaged):
                 "config": self.config,
             },
         }
-        with open(self.cache_dir / "freva_deployment.json", "w") as f:
-            json.dump({k: v for (k, v) in config.items()}, f, indent=3)
+        self.write_cache(config)
         if write_toml_file is False:
             return None
 
@@ -287,6 +327,20 @@ class MainApp(npyscreen.NPSAppManaged):
         """The user cachedir."""
         return Path(appdirs.user_cache_dir()) / "freva-deployment"
 
+    def write_cache(self, config: dict[str, Any]) -> None:
+        """Atomically replace the app cache, if its content changed."""
+        state = json.dumps(config, indent=3)
+        with self._save_lock:
+            if state == self._saved_state:
+                return
+            cache_file = self.cache_dir / "freva_deployment.json"
+            temp_file = cache_file.with_suffix(
+                f".{os.getpid()}.{threading.get_ident()}.tmp"
+            )
+            temp_file.write_text(state)
+            os.replace(temp_file, cache_file)
+            self._saved_state = state
+
     def _read_cache(
         self, key: str, default: str | list | bool | dict[str, str] = ""
     ) -> str | bool | list | dict[str, str]:
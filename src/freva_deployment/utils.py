@@ -9,8 +9,18 @@ import re
 import shutil
 import sys
 import sysconfig
+from copy import deepcopy
 from pathlib import Path
-from typing import Any, Dict, MutableMapping, NamedTuple, Optional, Union, cast
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Dict,
+    MutableMapping,
+    NamedTuple,
+    Optional,
+    Tuple,
+    cast,
+)
 from urllib.request import urlopen
 
 import appdirs
@@ -20,9 +30,11 @@ from rich.console import Console
 from rich.prompt import Prompt
 
 from .error import ConfigurationError
-from .keys import RandomKeys
 from .logger import logger
 
+if TYPE_CHECKING:
+    from .keys import LocalCA
+
 RichConsole = Console(markup=True, force_terminal=True)
 
 config_text = """
@@ -177,13 +189,24 @@ def get_cache_information(
     redis_port: Optional[str] = None,
     scheduler_host: Optional[str] = None,
     scheduler_port: Optional[str] = None,
+    ca: Optional[LocalCA] = None,
 ) -> Dict[str, str]:
-    """Create all information we need to setup the redis cache and the data portal."""
+    """Create all information we need to setup the redis cache and the data portal.
+
+    If a certificate authority is given, it issues the redis certificate,
+    otherwise the certificate is self-signed.
+    """
+    from .keys import KeyStore, RandomKeys
+
     user = ssl_cert = ssl_key = ""
     if redis_host:
-        keys = RandomKeys(
-            common_name=redis_host.rpartition("//")[-1].partition(":")[0]
-        )
+        common_name = redis_host.rpartition("//")[-1].partition(":")[0]
+        if ca is not None:
+            keys = ca.issue(common_name)
+        else:
+            keys = RandomKeys(
+                common_name=common_name, store=KeyStore.from_env()
+            )
         user = namegenerator.gen()
         ssl_cert = keys.certificate_chain.decode("utf-8")
         ssl_key = keys.private_key_pem.decode("utf-8")
@@ -240,40 +263,66 @@ def _update_config(
             new_config[key] = value
 
 
-def _create_new_config(inp_file: Path) -> Path:
-    """Update any old configuration file to a newer version."""
-    config = cast(
-        Dict[str, Dict[str, Dict[str, Union[str, float, int, bool]]]],
-        tomlkit.loads(inp_file.read_text()),
-    )
-    keys_to_check = {
-        "freva_rest": [
-            "freva_rest_host",
-            "search_server_host",
-            "mongodb_server_host",
-            "redis_host",
-            "oidc_url",
-            "oidc_client",
-            "oidc_client_secret",
-            "oidc_token_claims",
-            "data_loader_portal_hosts",
-            "admin_user",
-        ],
-        "web": [
-            "web_host",
-            "admin_user",
-            "chatbot_host",
-        ],
-        "db": ["vault_host", "db_host", "admin_user"],
-        "core": ["core_host"],
-    }
-    create_backup = False
-    config_tmpl = cast(
-        Dict[str, Any], tomlkit.loads(AD.inventory_file.read_text())
-    )
+_LEGACY_KEYS = {
+    "freva_rest": [
+        "freva_rest_host",
+        "search_server_host",
+        "mongodb_server_host",
+        "redis_host",
+        "oidc_url",
+        "oidc_client",
+        "oidc_client_secret",
+        "oidc_token_claims",
+        "data_loader_portal_hosts",
+        "admin_user",
+    ],
+    "web": [
+        "web_host",
+        "admin_user",
+        "chatbot_host",
+    ],
+    "db": ["vault_host", "db_host", "admin_user"],
+    "core": ["core_host"],
+}
+"""Keys of each section that were added after the first config version."""
+
+_TOML_CACHE: Dict[Tuple[Path, bool], Tuple[Tuple[int, int], Any]] = {}
+
+
+def _read_toml(inp_file: Path, migrate: bool = False) -> Any:
+    """Parse a toml file, the document is cached until the file changes."""
+    stat = inp_file.stat()
+    signature = (stat.st_mtime_ns, stat.st_size)
+    cached = _TOML_CACHE.get((inp_file, migrate))
+    if cached is not None and cached[0] == signature:
+        return cached[1]
+    if migrate:
+        config = deepcopy(_read_toml(inp_file))
+        if _migrate_config(config, _read_toml(AD.inventory_file)):
+            migrated = deepcopy(_read_toml(AD.inventory_file))
+            _update_config(migrated, config)
+            config = migrated
+        else:
+            config = _read_toml(inp_file)
+    else:
+        config = tomlkit.loads(inp_file.read_text(encoding="utf-8"))
+    _TOML_CACHE[(inp_file, migrate)] = (signature, config)
+    return config
+
+
+def _migrate_config(
+    config: MutableMapping[str, Any], config_tmpl: MutableMapping[str, Any]
+) -> bool:
+    """Update an old configuration to the current layout, in place.
+
+    Returns
+    -------
+    bool: True if anything had to be changed.
+    """
+    changed = False
     # Legacy keys:
     if "solr" in config or "databrowser" in config:
-        create_backup = True
+        changed = True
         if "solr" in config:
             config["freva_rest"] = config.pop("solr")
             for key in ("port", "mem"):
@@ -287,44 +336,64 @@ def _create_new_config(inp_file: Path) -> Path:
                 "freva_rest"
             ]["config"].pop("databrowser_port", "")
 
-    for section, keys in keys_to_check.items():
+    for section, keys in _LEGACY_KEYS.items():
         if isinstance(config[section].get("config"), dict):
-            create_backup = True
+            changed = True
             config[section]["config"][f"{section}_host"] = str(
                 config[section]["hosts"]
             )
-            config[section] = config[section]["config"]  # type: ignore
-        config[section].pop(f"{section}_playbook", "")
+            config[section] = config[section]["config"]
+        if config[section].pop(f"{section}_playbook", None) is not None:
+            changed = True
         for key in keys:
-            if key not in tomlkit.dumps(config):
+            if key not in config[section]:
                 config[section][key] = config_tmpl[section][key]
-                create_backup = True
+                changed = True
     for key in ("deployment_method",):
         if key not in config:
-            create_backup = True
+            changed = True
             config[key] = config_tmpl[key]
-    if create_backup:
+    return changed
+
+
+def load_config(
+    inp_file: str | Path, convert: bool = False, read_only: bool = False
+) -> dict[str, Any]:
+    """Load the inventory toml file and replace all environment variables.
+
+    Old configurations are updated to the current layout, the original
+    file is kept as a backup. Parsed files are cached until they change.
+
+    Parameters
+    ----------
+    inp_file: str | Path
+        The inventory file.
+    convert: bool, default: False
+        Replace the variables and the $CFD of the config values.
+    read_only: bool, default: False
+        Never update the file. Unless ``convert`` is set the cached config
+        is returned, which must not be modified.
+    """
+    inp_file = Path(inp_file).expanduser().absolute()
+    config = _read_toml(inp_file, migrate=True)
+    if not read_only and config is not _read_toml(inp_file):
         backup_file = inp_file.with_suffix(inp_file.suffix + ".bck")
         logger.info(
             "Updating config file, original config can be found in %s",
             backup_file,
         )
         backup_file.write_text(inp_file.read_text())
-        _update_config(config_tmpl, config)
-        inp_file.write_text(tomlkit.dumps(config_tmpl))
-    return inp_file
-
-
-def load_config(inp_file: str | Path, convert: bool = False) -> dict[str, Any]:
-    """Load the inventory toml file and replace all environment variables."""
-    inp_file = _create_new_config(Path(inp_file).expanduser().absolute())
-    variables = cast(
-        dict[str, str], tomlkit.loads(config_file.read_text())["variables"]
-    )
-    config = tomlkit.loads(inp_file.read_text(encoding="utf-8"))
+        inp_file.write_text(tomlkit.dumps(config))
+        config = _read_toml(inp_file, migrate=True)
+    if read_only and not convert:
+        return cast(dict[str, Any], config)
+    config = deepcopy(config)
     if convert:
+        variables = cast(
+            dict[str, str], _read_toml(config_file)["variables"].unwrap()
+        )
         _convert_dict(config, variables, inp_file.parent)
-    return config
+    return cast(dict[str, Any], config)
 
 
 def get_setup_for_service(
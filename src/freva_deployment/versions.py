@@ -5,22 +5,31 @@ import json
 import os
 import ssl
 import sys
-from datetime import datetime
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
-from typing import Any, Dict, List
-from urllib.request import urlopen
+from typing import Any, Dict, List, Optional, Tuple, cast
+from urllib.error import HTTPError
+from urllib.request import Request, urlopen
 
 from appdirs import user_cache_dir
 from packaging.version import Version
 from rich import print as pprint
 from rich.prompt import Prompt
 
-from .error import ConfigurationError, handled_exception
+from .logger import logger
 
 ssl_context = ssl._create_unverified_context()
 
 
 class VersionAction(argparse._VersionAction):
+    """Display the version.
+
+    The versions of the services are only resolved if the version string
+    contains a ``%(services)s`` placeholder and the action is called.
+    """
+
     def __call__(
         self,
         parser: argparse.ArgumentParser,
@@ -29,7 +38,14 @@ class VersionAction(argparse._VersionAction):
         option_string=None,
     ):
         version = self.version or "%(prog)s"
-        pprint(version % {"prog": parser.prog or sys.argv[1]})
+        services = ""
+        if "%(services)s" in version:
+            VersionManifest().refresh_if_stale()
+            services = display_versions()
+        pprint(
+            version
+            % {"prog": parser.prog or sys.argv[1], "services": services}
+        )
         parser.exit()
 
 
@@ -52,51 +68,233 @@ def display_versions() -> str:
     return versions
 
 
-@handled_exception
-def get_versions(_versions: List[Dict[str, str]] = []) -> Dict[str, str]:
-    """Read the neccesary versions of microservices."""
-    if _versions:
-        return _versions[0]
-    version_file = Path(user_cache_dir("freva-deployment")) / "versions.json"
-    now = datetime.now()
-    service_version = json.loads(
-        (Path(__file__).parent / "versions.json").read_text()
-    )
-    if (
-        version_file.exists()
-        and (
-            now - datetime.fromtimestamp(version_file.stat().st_mtime)
-        ).total_seconds()
-        < 3600 * 1000
-    ):
-        versions = json.loads(version_file.read_text())
-        versions.update(service_version)
-        _versions.append(versions)
-        return _versions[0]
-    version_file.parent.mkdir(exist_ok=True, parents=True)
-    _versions.append(
-        json.loads((Path(__file__).parent / "versions.json").read_text())
-    )
+class VersionManifest:
+    """Cache of the versions of the external micro-services.
+
+    The versions of the external services are read from the
+    freva-service-config repository. All services are fetched
+    concurrently and conditional requests (ETag/If-Modified-Since) are used
+    to avoid re-downloading unchanged files. Once the cache has expired the
+    stale versions are served while a refresh runs in the background.
+    Services whose version is neither cached nor shipped fall back to the
+    ``latest`` images, with a warning.
+
+    Parameters
+    ----------
+    cache_file: Path, default: None
+        Path to the file holding the cached manifest, defaults to the
+        user cache dir.
+    ttl: float, default: None
+        Time in seconds the cached versions are considered fresh. Defaults
+        to the ``FREVA_DEPLOYMENT_VERSIONS_TTL`` env variable or one hour.
+    timeout: float, default: None
+        Timeout in seconds for reading a single version file. Defaults to
+        the ``FREVA_DEPLOYMENT_VERSIONS_TIMEOUT`` env variable or 5 seconds.
+    offline: bool, default: None
+        Never access the network, only use the cached and shipped versions.
+        Defaults to the ``FREVA_DEPLOYMENT_OFFLINE`` env variable.
+    """
+
     url = (
         "https://raw.githubusercontent.com/freva-org/freva-service-config"
         "/refs/heads/main/{service}/requirements.txt"
     )
+    services: Dict[str, str] = {
+        "mongo": "mongodb_server",
+        "solr": "solr",
+        "nginx": "nginx",
+        "redis": "redis",
+    }
+    fallback_version = "latest"
+
+    def __init__(
+        self,
+        cache_file: Optional[Path] = None,
+        ttl: Optional[float] = None,
+        timeout: Optional[float] = None,
+        offline: Optional[bool] = None,
+    ) -> None:
+        self.cache_file = cache_file or (
+            Path(user_cache_dir("freva-deployment")) / "version_manifest.json"
+        )
+        self.ttl = float(
+            os.getenv("FREVA_DEPLOYMENT_VERSIONS_TTL", "3600")
+            if ttl is None
+            else ttl
+        )
+        self.timeout = float(
+            os.getenv("FREVA_DEPLOYMENT_VERSIONS_TIMEOUT", "5")
+            if timeout is None
+            else timeout
+        )
+        if offline is None:
+            offline = os.getenv("FREVA_DEPLOYMENT_OFFLINE", "0").lower() in (
+                "1",
+                "true",
+                "yes",
+            )
+        self.offline = offline
+        self._refresh_thread: Optional[threading.Thread] = None
 
-    for service in ("mongo", "solr", "nginx", "redis"):
+    @property
+    def shipped_versions(self) -> Dict[str, str]:
+        """The versions that are shipped with this package."""
+        return cast(
+            Dict[str, str],
+            json.loads((Path(__file__).parent / "versions.json").read_text()),
+        )
+
+    def read_cache(self) -> Dict[str, Any]:
+        """Read the cached manifest."""
+        try:
+            manifest = json.loads(self.cache_file.read_text())
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+        manifest.setdefault("versions", {})
+        manifest.setdefault("headers", {})
+        manifest.setdefault("fetched", 0)
+        return cast(Dict[str, Any], manifest)
+
+    def _write_cache(self, manifest: Dict[str, Any]) -> None:
+        """Atomically replace the cached manifest."""
+        self.cache_file.parent.mkdir(exist_ok=True, parents=True)
+        temp_file = self.cache_file.with_suffix(f".{os.getpid()}.tmp")
+        temp_file.write_text(json.dumps(manifest, indent=3))
+        os.replace(temp_file, self.cache_file)
+
+    def _fetch(
+        self, service: str, headers: Dict[str, str]
+    ) -> Tuple[Optional[str], Dict[str, str]]:
+        """Fetch the version of a service.
+
+        Returns
+        -------
+        tuple: The version, None if it hasn't changed, and the validators
+               of the response.
+        """
+        request_headers = {}
+        if headers.get("etag"):
+            request_headers["If-None-Match"] = headers["etag"]
+        if headers.get("last_modified"):
+            request_headers["If-Modified-Since"] = headers["last_modified"]
+        request = Request(
+            self.url.format(service=service), headers=request_headers
+        )
         try:
-            with urlopen(url.format(service=service), context=ssl_context) as res:
+            with urlopen(
+                request, context=ssl_context, timeout=self.timeout
+            ) as res:
                 text = res.read().decode()
-        except Exception as error:
-            raise ConfigurationError(
-                f"Could not read version for service {service}: {error}"
-            )
+                validators = {
+                    "etag": res.headers.get("ETag", ""),
+                    "last_modified": res.headers.get("Last-Modified", ""),
+                }
+        except HTTPError as error:
+            if error.code == 304:
+                return None, headers
+            raise
         for line in text.splitlines():
             if not line.startswith("#") and "=" in line:
-                version = line.strip().split("=")[-1]
-                _versions[0][service] = version
-                break
-    _versions[0]["mongodb_server"] = _versions[0].pop("mongo")
-    version_file.write_text(json.dumps(_versions[0]))
+                return line.strip().split("=")[-1], validators
+        raise ValueError(f"No version defined for {service}")
+
+    def refresh(self) -> Dict[str, str]:
+        """Fetch all service versions concurrently and update the cache."""
+        manifest = self.read_cache() or {
+            "versions": {},
+            "headers": {},
+            "fetched": 0,
+        }
+        complete = True
+        with ThreadPoolExecutor(max_workers=len(self.services)) as pool:
+            futures = {
+                pool.submit(
+                    self._fetch, service, manifest["headers"].get(name, {})
+                ): (service, name)
+                for service, name in self.services.items()
+            }
+            for future in as_completed(futures):
+                service, name = futures[future]
+                try:
+                    version, validators = future.result()
+                except Exception as error:
+                    logger.warning(
+                        "Could not read version for service %s: %s",
+                        service,
+                        error,
+                    )
+                    complete = False
+                    continue
+                if version is not None:
+                    manifest["versions"][name] = version
+                manifest["headers"][name] = validators
+        if complete:
+            # Only a complete manifest counts as fresh, otherwise the next
+            # call will try again.
+            manifest["fetched"] = time.time()
+        try:
+            self._write_cache(manifest)
+        except OSError as error:
+            logger.warning("Could not write version cache: %s", error)
+        return cast(Dict[str, str], manifest["versions"])
+
+    def refresh_in_background(self) -> None:
+        """Start a background refresh of the cache, if none is running."""
+        if self._refresh_thread and self._refresh_thread.is_alive():
+            return
+        self._refresh_thread = threading.Thread(
+            target=self.refresh, name="version-manifest-refresh", daemon=True
+        )
+        self._refresh_thread.start()
+
+    def refresh_if_stale(self) -> None:
+        """Refresh an expired cache right away, not in the background.
+
+        Short running commands would exit before a background refresh has
+        written the cache.
+        """
+        if not self.offline and (
+            time.time() - self.read_cache().get("fetched", 0) > self.ttl
+        ):
+            self.refresh()
+
+    def get(self) -> Dict[str, str]:
+        """Get the versions of all services."""
+        manifest = self.read_cache()
+        versions = cast(Dict[str, str], manifest.get("versions", {}))
+        if not self.offline:
+            age = time.time() - manifest.get("fetched", 0)
+            if not manifest:
+                versions = self.refresh()
+            elif age > self.ttl:
+                self.refresh_in_background()
+        shipped = self.shipped_versions
+        fallback = {
+            name: self.fallback_version
+            for name in self.services.values()
+            if name not in versions and name not in shipped
+        }
+        if fallback:
+            hint = (
+                "unset FREVA_DEPLOYMENT_OFFLINE"
+                if self.offline
+                else "check the connection to "
+                + self.url.partition("/{service}")[0]
+            )
+            logger.warning(
+                "The versions of %s are unknown, the %s images are deployed "
+                "instead, %s.",
+                ", ".join(sorted(fallback)),
+                self.fallback_version,
+                hint,
+            )
+        return {**fallback, **versions, **shipped}
+
+
+def get_versions(_versions: List[Dict[str, str]] = []) -> Dict[str, str]:
+    """Read the neccesary versions of microservices."""
+    if not _versions:
+        _versions.append(VersionManifest().get())
     return _versions[0]
 
 